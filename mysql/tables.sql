@@ -19,6 +19,7 @@ CREATE TABLE refresh_tokens (
 
     PRIMARY KEY (jti),
     KEY idx_user_id (user_id),
+    KEY idx_expires_at (expires_at),
 
     CONSTRAINT fk_refresh_tokens_user
         FOREIGN KEY (user_id) REFERENCES users(id)
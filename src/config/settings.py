@@ -8,6 +8,7 @@
     DB_PORT         - database port
     JWT_SECRET      - JWT HS256 secret eky
     JWT_ISSUER      - JWT issuer
+    STORAGE_BACKEND - (optional) dotted path of the file storage backend
 """
 
 import os
@@ -111,6 +112,12 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Rows fetched per query by the NDJSON export endpoints
+EXPORT_CHUNK_SIZE = 2000
+
+# Upper bound on folders x entries in one POST /permissions/batch
+MAX_PERMISSION_BATCH = 5000
+
 ALLOWED_MIME_TYPES = [
         "application/pdf",
         "text/plain"
@@ -141,6 +148,63 @@ JWT_ISSUER = os.getenv("JWT_ISSUER")
 JWT_EXP_MINUTES = 3
 JWT_REFRESH_EXP_MINUTES = 15
 
+# File contents storage: core.services.storage.AzureBlobStorage,
+# LocalFileStorage (under LOCAL_STORAGE_ROOT) or InMemoryStorage
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "core.services.storage.AzureBlobStorage")
+LOCAL_STORAGE_ROOT = os.getenv("LOCAL_STORAGE_ROOT", BASE_DIR / ".." / "storage")
+
 BLOB_ACCOUNT_URL = "https://busblobstorage.blob.core.windows.net"
 BLOB_CONTAINER_NAME = "data"
 
+# POST /file/upload streams the file into storage blocks of UPLOAD_BLOCK_SIZE
+# bytes, staging at most UPLOAD_BLOCKS_IN_FLIGHT per upload and
+# UPLOAD_BLOCK_WORKERS across the process.
+UPLOAD_BLOCK_SIZE = 4 * 1024 * 1024
+UPLOAD_BLOCKS_IN_FLIGHT = 4
+UPLOAD_BLOCK_WORKERS = 16
+
+# Direct uploads: lifetime of the write SAS URL, and how much longer the
+# client has to call /complete before the pending upload is purged (seconds).
+UPLOAD_SAS_TTL = 300
+UPLOAD_COMPLETE_GRACE = 300
+
+# Serve file upload/download/delete from async views using the aio Azure
+# client. Only worthwhile when running under ASGI (config/asgi.py).
+ASYNC_BLOB_VIEWS = os.getenv("ASYNC_BLOB_VIEWS", "0") == "1"
+
+# Downloads are either proxied through the app ("proxy") or, on storage that
+# can sign URLs, answered with a 302 to a read-only URL valid for
+# DOWNLOAD_SAS_TTL seconds ("redirect"). Clients can force proxying with ?proxy=1.
+DOWNLOAD_MODE = os.getenv("DOWNLOAD_MODE", "proxy")
+DOWNLOAD_SAS_TTL = 30
+
+# Resumable uploads: bytes per chunk, and how long a session may take (seconds)
+# before purge_pending_uploads discards it and its staged chunks.
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+UPLOAD_SESSION_TTL = 24 * 60 * 60
+
+# Per-process cache of User.token_version used when validating access tokens.
+# TTL (seconds) bounds how long other workers may accept a token after logout.
+TOKEN_VERSION_CACHE_SIZE = 10000
+TOKEN_VERSION_CACHE_TTL = 10
+
+# Per-process cache of resolved folder permissions, same semantics as above.
+FOLDER_PERMISSION_CACHE_SIZE = 10000
+FOLDER_PERMISSION_CACHE_TTL = 10
+
+# Password hashing pool used by login/register. Requests beyond
+# workers + queue size get 503 with Retry-After (seconds).
+PASSWORD_HASHING_WORKERS = 4
+PASSWORD_HASHING_QUEUE_SIZE = 32
+PASSWORD_HASHING_RETRY_AFTER = 1
+
+# Blobs of deleted folders are removed by BLOB_DELETION_WORKERS background
+# threads, BLOB_DELETION_BATCH_SIZE at a time. Failed blobs are retried after
+# BLOB_DELETION_RETRY_DELAY seconds, up to BLOB_DELETION_MAX_ATTEMPTS times.
+BLOB_DELETION_WORKERS = 2
+BLOB_DELETION_BATCH_SIZE = 256
+BLOB_DELETION_MAX_ATTEMPTS = 5
+BLOB_DELETION_RETRY_DELAY = 5
+
+# Maximum bytes stored across all folders a user owns; None means unlimited.
+USER_STORAGE_QUOTA = None
@@ -1,123 +1,662 @@
 import json
+import os
+from dataclasses import dataclass
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from django.http import JsonResponse, HttpRequest
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, HttpResponseRedirect, JsonResponse, HttpRequest, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
-from azure.identity import ManagedIdentityCredential
-from azure.storage.blob import BlobServiceClient
-from django.http import StreamingHttpResponse, Http404
-from core.services.jwt import validate_jwt, decode_user_uuid
-from core.services.helpers import get_folder_by_uuid, get_user_folder_permissions, get_user_by_uuid, get_file_by_uuid
+from core.services.helpers import get_folder_by_uuid, get_user_folder_permissions, get_file_by_uuid
+from core.services.helpers import PERM_READ, PERM_UPLOAD, PERM_DELETE
+from core.services.usage import add_file_usage, remove_file_usage, quota_allows
+from core.services.storage import BlobNotFound, BlobVersion, block_id, get_storage
+from core.services.ranges import RangeNotSatisfiable, if_range_matches, parse_range_header
+from core.decorators import jwt_required
+from core.upload_handlers import StagedBlobUploadHandler
 from django.views.decorators.http import require_POST, require_GET, require_http_methods
-from core.models import File
-
-
-credential = ManagedIdentityCredential()  # Or User Assigned MI
-blob_service_client = BlobServiceClient(account_url=settings.BLOB_ACCOUNT_URL, credential=credential)
+from core.models import File, PendingUpload
+import uuid
+from datetime import datetime, timedelta, timezone
 
 
 @csrf_exempt
 @require_POST
+@jwt_required
 def upload_file(request):
     """
-    POST /file/upload
+    POST /file/upload?dir=<uuid>&size=<bytes>
     Cookie: acces_token=...
     Content-type: multipart/form-data
 
     -------
     file
     -------
-    dir
+    dir         (only when not in the URL)
     -------
+
+    With dir (and optionally size) in the URL, access and quota are checked
+    before the body is read and the file streams straight into storage
+    blocks. size defaults to the request's Content-Length; a larger file is
+    rejected mid-stream. Without it dir is read from the form as before:
+    Django buffers the file (in memory or a temp file) until dir is checked,
+    and only then is it written to storage.
     """
-    # 1. Check user's JWT token
-    token = request.COOKIES.get("access_token")
-    if not token or not validate_jwt(token):
-        return JsonResponse({"error": "Unauthorized"}, status=401)
+    # 1. User's JWT token is checked by @jwt_required
+    if "dir" not in request.GET:
+        return _upload_buffered(request)
 
-    # 2. Get file data
-    file = request.FILES.get("file")
-    dir = request.POST.get("dir")
+    # 2. Check the user's access to dir and room for the file
+    folder, size, error = _authorize_upload(request)
+    if error:
+        return error
+
+    # 3. Stream the file into staged storage blocks while the body is parsed
+    handler = StagedBlobUploadHandler(request, max_size=size)
+    request.upload_handlers = [handler]
+    file, error = _read_upload_form(request, handler)
+    if error:
+        return error
+
+    # 4. Commit the blob, then record it with the metadata storage reported
+    try:
+        version = file.commit()
+    except Exception:
+        file.discard()
+        raise
+    return _record_upload(folder, file.file_id, file.name, file.size, file.content_type, version)
+
+
+@csrf_exempt
+@require_POST
+@jwt_required
+async def aupload_file(request: HttpRequest):
+    """
+    Async POST /file/upload, same contract as upload_file. The body is
+    parsed (and its blocks staged) in a worker thread; the commit runs on
+    the event loop.
+    """
+    if "dir" not in request.GET:
+        return await sync_to_async(_upload_buffered)(request)
+
+    folder, size, error = await sync_to_async(_authorize_upload)(request)
+    if error:
+        return error
+
+    handler = StagedBlobUploadHandler(request, max_size=size)
+    request.upload_handlers = [handler]
+    file, error = await sync_to_async(_read_upload_form, thread_sensitive=False)(request, handler)
+    if error:
+        return error
+
+    try:
+        version = await file.acommit()
+    except Exception:
+        await sync_to_async(file.discard, thread_sensitive=False)()
+        raise
+    return await sync_to_async(_record_upload)(folder, file.file_id, file.name, file.size, file.content_type, version)
+
+
+def _authorize_upload(request: HttpRequest):
+    """The upload's folder and the most bytes it may take, or an error response."""
+    try:
+        dir = uuid.UUID(request.GET.get("dir", ""))
+        size = int(request.GET.get("size") or request.META.get("CONTENT_LENGTH") or 0)
+    except ValueError:
+        return None, 0, JsonResponse({"error": "Invalid request"}, status=400)
+    if size < 0:
+        return None, 0, JsonResponse({"error": "Invalid request"}, status=400)
+    if "size" in request.GET and size > getattr(settings, "MAX_UPLOAD_SIZE", 50 * 1024 * 1024):
+        return None, 0, JsonResponse({"error": "File too large"}, status=400)
+
+    folder, error = _authorize_folder(dir, size, request.principal)
+    return folder, size, error
+
+
+def _authorize_folder(dir, size: int, user):
+    folder = get_folder_by_uuid(dir)
+    if not folder or not get_user_folder_permissions(folder, user) & PERM_UPLOAD:
+        return None, JsonResponse({"error": "Forbidden"}, status=403)
+
+    if not quota_allows(folder, size):
+        return None, JsonResponse({"error": "Storage quota exceeded"}, status=413)
+    return folder, None
+
+
+def _upload_buffered(request: HttpRequest):
+    """POST /file/upload with dir as a form field; the file is checked before it is stored."""
+    file, dir = request.FILES.get("file"), request.POST.get("dir")
     if not file or not dir:
         return JsonResponse({"error": "No file uploaded"}, status=400)
     if file.size > getattr(settings, "MAX_UPLOAD_SIZE", 50 * 1024 * 1024):
         return JsonResponse({"error": "File too large"}, status=400)
     if file.content_type not in settings.ALLOWED_MIME_TYPES:
         return JsonResponse({"error": f"Invalid file type: {file.content_type}"}, status=400)
-
-    # 3. Check if user has dir access
-    folder = get_folder_by_uuid(dir)
-    user = get_user_by_uuid(decode_user_uuid(token))
-    if not folder or not user:
+    try:
+        dir = uuid.UUID(dir)
+    except ValueError:
         return JsonResponse({"error": "Forbidden"}, status=403)
 
-    if "upload" not in get_user_folder_permissions(folder, user):
+    folder, error = _authorize_folder(dir, file.size, request.principal)
+    if error:
+        return error
+
+    file_id = uuid.uuid4()
+    version = get_storage().save(f"{file_id}_{file.name}", file, file.content_type)
+    return _record_upload(folder, file_id, file.name, file.size, file.content_type, version)
+
+
+def _read_upload_form(request: HttpRequest, handler: StagedBlobUploadHandler):
+    """The staged file, or an error response if the handler rejected it or none was sent."""
+    file = request.FILES.get("file")
+    if handler.error:
+        return None, JsonResponse({"error": handler.error}, status=400)
+    if not file:
+        return None, JsonResponse({"error": "No file uploaded"}, status=400)
+    return file, None
+
+
+def _record_upload(folder, file_id, name: str, size: int, content_type: str, version: BlobVersion):
+    blob_name = f"{file_id}_{name}"
+    try:
+        with transaction.atomic():
+            charged = add_file_usage(folder, size)
+            if charged:
+                _create_file(file_id, name, folder, size, blob_name, content_type, version)
+    except IntegrityError:
+        # the folder was deleted while the file was uploading
+        get_storage().delete(blob_name)
+        return JsonResponse({"error": "Folder not found"}, status=404)
+    if not charged:
+        # another upload used up the quota since the check above
+        get_storage().delete(blob_name)
+        return JsonResponse({"error": "Storage quota exceeded"}, status=413)
+
+    return JsonResponse({
+        "id": blob_name,
+        "original_name": name,
+        "size": size
+    })
+
+
+def _create_file(id, name: str, folder, size: int, blob_name: str, content_type: str, version: BlobVersion) -> File:
+    return File.objects.create(
+        id=id,
+        name=name,
+        folder=folder,
+        size=size,
+        blob_name=blob_name,
+        content_type=content_type,
+        etag=version.etag,
+        content_md5=version.content_md5 or "",
+        modified_at=version.last_modified,
+    )
+
+
+@csrf_exempt
+@require_POST
+@jwt_required
+def start_upload(request: HttpRequest):
+    """
+    POST /file/upload/start
+    Cookie: access_token=...
+    Body: { "dir": "<uuid>", "name": "...", "size": 1234, "contentType": "application/pdf", "chunked": false }
+
+    Authorises a direct upload and returns a short-lived, write-only URL
+    for the blob. The client PUTs the file there and then calls
+    POST /file/upload/<uploadId>/complete. Only storage backends that can
+    sign URLs (Azure) support this; others answer 501.
+
+    With "chunked": true it opens a resumable upload session instead. The
+    client PUTs chunks of chunkSize bytes to /file/upload/<uploadId>/chunks/<n>,
+    in any order or in parallel, can GET /file/upload/<uploadId> to see which
+    chunks are stored, and completes as above before expiresAt.
+    """
+    # 1. User's JWT token is checked by @jwt_required
+
+    # 2. Get file data
+    try:
+        data = json.loads(request.body)
+        dir = uuid.UUID(str(data["dir"]))
+        name, size, content_type = str(data["name"]), int(data["size"]), str(data["contentType"])
+        chunked = bool(data.get("chunked", False))
+    except (KeyError, TypeError, ValueError):
+        return JsonResponse({"error": "Invalid request"}, status=400)
+    name = _sanitize_file_name(name)
+    if not name or size < 0:
+        return JsonResponse({"error": "Invalid request"}, status=400)
+    if size > getattr(settings, "MAX_UPLOAD_SIZE", 50 * 1024 * 1024):
+        return JsonResponse({"error": "File too large"}, status=400)
+    if content_type not in settings.ALLOWED_MIME_TYPES:
+        return JsonResponse({"error": f"Invalid file type: {content_type}"}, status=400)
+
+    # 3. Check if user has dir access and room for the file
+    folder = get_folder_by_uuid(dir)
+    if not folder or not get_user_folder_permissions(folder, request.principal) & PERM_UPLOAD:
         return JsonResponse({"error": "Forbidden"}, status=403)
-    
+    if not quota_allows(folder, size):
+        return JsonResponse({"error": "Storage quota exceeded"}, status=413)
 
-    file_db = File.objects.create(
-            name=file.name,
+    if chunked:
+        upload = PendingUpload.objects.create(
+            name=name,
             folder=folder,
-            size = file.size
+            user=request.principal,
+            size=size,
+            content_type=content_type,
+            chunk_size=settings.UPLOAD_CHUNK_SIZE,
+            expires_at=datetime.now(tz=timezone.utc) + timedelta(seconds=settings.UPLOAD_SESSION_TTL),
         )
-    blob_name = f"{file_db.id}_{file_db.name}"
+        return JsonResponse(_serialize_session(upload, []), status=201)
+
+    # 4. Record the pending upload and sign a URL for its blob
+    storage = get_storage()
+    if not storage.supports_signed_urls:
+        return JsonResponse({"error": "Direct uploads are not supported"}, status=501)
+    sas_expiry = datetime.now(tz=timezone.utc) + timedelta(seconds=settings.UPLOAD_SAS_TTL)
+    upload = PendingUpload.objects.create(
+        name=name,
+        folder=folder,
+        user=request.principal,
+        size=size,
+        content_type=content_type,
+        expires_at=sas_expiry + timedelta(seconds=settings.UPLOAD_COMPLETE_GRACE),
+    )
+    url, headers = storage.upload_url(upload.blob_name, content_type, sas_expiry)
+
+    return JsonResponse({
+        "uploadId": str(upload.id),
+        "url": url,
+        "expiresAt": sas_expiry.isoformat(),
+        "headers": headers,
+    }, status=201)
+
+
+def _sanitize_file_name(name: str) -> str:
+    """
+    The last path component of a client-supplied name, like Django gives
+    multipart uploads, or "" if nothing usable is left.
+    """
+    name = os.path.basename(name.replace("\\", "/")).strip()
+    if name in (".", "..") or len(name) > File._meta.get_field("name").max_length:
+        return ""
+    return name
+
+
+def _get_pending_upload(request: HttpRequest, upload_id: str):
+    upload = PendingUpload.objects.select_related("folder").filter(id=upload_id, user=request.principal).first()
+    if not upload or upload.expires_at < datetime.now(tz=timezone.utc):
+        return None, JsonResponse({"error": "Upload not found"}, status=404)
+    if not get_user_folder_permissions(upload.folder, request.principal) & PERM_UPLOAD:
+        return None, JsonResponse({"error": "Forbidden"}, status=403)
+    return upload, None
+
+
+def _stored_chunks(upload: PendingUpload) -> list[int]:
+    staged = get_storage().staged_blocks(upload.blob_name)
+    return [
+        index for index in range(upload.chunk_count)
+        if staged.get(block_id(index)) == upload.chunk_length(index)
+    ]
+
+
+def _serialize_session(upload: PendingUpload, received: list[int]) -> dict:
+    return {
+        "uploadId": str(upload.id),
+        "chunkSize": upload.chunk_size,
+        "chunkCount": upload.chunk_count,
+        "received": received,
+        "expiresAt": upload.expires_at.isoformat(),
+    }
+
+
+@csrf_exempt
+@require_http_methods(["GET", "DELETE"])
+@jwt_required
+def upload_session(request: HttpRequest, upload_id: str):
+    """
+    GET /file/upload/<uuid>     - chunks stored so far
+    DELETE /file/upload/<uuid>  - abandon the upload
+    Cookie: access_token=...
+    """
+    upload, error = _get_pending_upload(request, upload_id)
+    if error:
+        return error
+    if not upload.chunk_size:
+        return JsonResponse({"error": "Upload not found"}, status=404)
 
-    blob_client = blob_service_client.get_blob_client(container=settings.BLOB_CONTAINER_NAME, blob=blob_name)
-    blob_client.upload_blob(file.file, overwrite=True, content_type=file.content_type)
+    if request.method == "GET":
+        return JsonResponse(_serialize_session(upload, _stored_chunks(upload)))
+
+    get_storage().discard_blocks(upload.blob_name)
+    upload.delete()
+    return JsonResponse({"message": "success"})
+
+
+@csrf_exempt
+@require_http_methods(["PUT"])
+@jwt_required
+def upload_chunk(request: HttpRequest, upload_id: str, index: int):
+    """
+    PUT /file/upload/<uuid>/chunks/<n>
+    Cookie: access_token=...
+    Body: raw bytes of chunk n; every chunk but the last is chunkSize long
+
+    Re-sending a chunk replaces it, so a client can retry any chunk whose
+    response it did not see.
+    """
+    upload, error = _get_pending_upload(request, upload_id)
+    if error:
+        return error
+    if not upload.chunk_size or index >= upload.chunk_count:
+        return JsonResponse({"error": "Chunk not found"}, status=404)
+
+    # read() rather than request.body, which is capped at DATA_UPLOAD_MAX_MEMORY_SIZE
+    expected = upload.chunk_length(index)
+    data = request.read(expected + 1)
+    if len(data) != expected:
+        return JsonResponse({"error": f"Chunk {index} must be {expected} bytes"}, status=400)
+
+    try:
+        get_storage().stage_block(upload.blob_name, block_id(index), data)
+    except BlobNotFound:
+        # a name the backend cannot store, from before start_upload sanitised it
+        return JsonResponse({"error": "Invalid file name"}, status=400)
+    return HttpResponse(status=204)
+
+
+@csrf_exempt
+@require_POST
+@jwt_required
+def complete_upload(request: HttpRequest, upload_id: str):
+    """
+    POST /file/upload/<uuid>/complete
+    Cookie: access_token=...
+    """
+    upload, error = _get_pending_upload(request, upload_id)
+    if error:
+        return error
+
+    # 1. Assemble a chunked upload from its staged blocks
+    blob_name = upload.blob_name
+    storage = get_storage()
+    if upload.chunk_size:
+        received = _stored_chunks(upload)
+        if len(received) != upload.chunk_count:
+            body = {"error": "Upload is missing chunks", **_serialize_session(upload, received)}
+            return JsonResponse(body, status=409)
+        # no MD5 to pass: chunks arrive out of order, so none is computed here
+        version = storage.commit_blocks(blob_name, [block_id(index) for index in received], upload.content_type)
+
+    # 2. Verify what actually landed in storage
+    else:
+        try:
+            version = storage.properties(blob_name)
+        except BlobNotFound:
+            return JsonResponse({"error": "File has not been uploaded"}, status=400)
+
+        if version.size != upload.size or version.content_type != upload.content_type:
+            # The pending row stays until it expires: the signed URL is valid
+            # until then, and purge_pending_uploads removes anything PUT again.
+            storage.delete(blob_name)
+            return JsonResponse({"error": "Uploaded file does not match the declared size or type"}, status=400)
+
+    # 3. Commit the file; deleting the pending row first makes completion idempotent
+    try:
+        with transaction.atomic():
+            claimed = PendingUpload.objects.filter(id=upload.id).delete()[0] == 1
+            charged = claimed and add_file_usage(upload.folder, upload.size)
+            if charged:
+                _create_file(
+                    upload.id, upload.name, upload.folder, upload.size, blob_name, upload.content_type, version
+                )
+    except IntegrityError:
+        # the folder was deleted while the upload was completing
+        storage.delete(blob_name)
+        return JsonResponse({"error": "Folder not found"}, status=404)
+
+    if not claimed:
+        # Completed by a concurrent request, or the folder (and with it the
+        # pending row) was deleted; in the latter case nothing owns the blob.
+        if not File.objects.filter(id=upload.id).exists():
+            storage.delete_many([blob_name])
+        return JsonResponse({"error": "Upload not found"}, status=404)
+    if not charged:
+        storage.delete(blob_name)
+        return JsonResponse({"error": "Storage quota exceeded"}, status=413)
 
     return JsonResponse({
         "id": blob_name,
-        "original_name": file.name,
-        "size": file.size
+        "original_name": upload.name,
+        "size": upload.size
     })
 
+
 @csrf_exempt
 @require_http_methods(["GET", "DELETE"])
+@jwt_required
 def get_delete_file(request: HttpRequest, file_id: str):
-    # 1. Check user's JWT token
-    token = request.COOKIES.get("access_token")
-    if not token or not validate_jwt(token):
-        return JsonResponse({"error": "Unauthorized"}, status=401)
+    # 1. User's JWT token is checked by @jwt_required
 
     # 2. Get file and user
     file = get_file_by_uuid(file_id)
-    user = get_user_by_uuid(decode_user_uuid(token))
-    if not file or not user:
+    user = request.principal
+    if not file:
         return JsonResponse({"error": "Forbidden"}, status=403)
 
-    perm, func = ("read", download_file) if request.method == "GET" else ("delete", delete_file)
+    perm, func = (PERM_READ, download_file) if request.method == "GET" else (PERM_DELETE, delete_file)
 
     # 3. Check user's permissions
-    if perm not in get_user_folder_permissions(file.folder, user):
+    if not get_user_folder_permissions(file.folder, user) & perm:
         return JsonResponse({"error": "Forbidden"}, status=403)
 
-    filename = f"{file.id}_{file.name}"
-    blob_client = blob_service_client.get_blob_client(container=settings.BLOB_CONTAINER_NAME, blob=filename)
+    # 4. Perform the operation; a missing blob is reported by the storage call itself
+    try:
+        return func(request=request, storage=get_storage(), file=file)
+    except BlobNotFound:
+        return JsonResponse({"error": f"file {file.blob_name} not found"}, status=500)
+
+
+@csrf_exempt
+@require_http_methods(["GET", "DELETE"])
+@jwt_required
+async def aget_delete_file(request: HttpRequest, file_id: str):
+    """
+    Async GET/DELETE /file/uploaded/<uuid>, same contract as get_delete_file.
+    Downloads stream through an async iterator, so a slow client holds no thread.
+    """
+    file = await File.objects.select_related("folder").filter(id=file_id).afirst()
+    if not file:
+        return JsonResponse({"error": "Forbidden"}, status=403)
 
-    if not blob_client.exists():
-        return JsonResponse({"error": f"file {filename} not found"}, status=500)
+    perm, func = (PERM_READ, adownload_file) if request.method == "GET" else (PERM_DELETE, adelete_file)
+    if not await sync_to_async(get_user_folder_permissions)(file.folder, request.principal) & perm:
+        return JsonResponse({"error": "Forbidden"}, status=403)
 
-    # 4. Perform the operation
-    return func(blob_client=blob_client, filename=filename, file=file)
+    try:
+        return await func(request=request, storage=get_storage(), file=file)
+    except BlobNotFound:
+        return JsonResponse({"error": f"file {file.blob_name} not found"}, status=500)
 
 
 def download_file(**kwargs):
+    request, storage, file = kwargs["request"], kwargs["storage"], kwargs["file"]
 
-    stream = kwargs["blob_client"].download_blob()
+    response, ranges = _plan_download(request, storage, file)
+    if response is _REDIRECT:
+        return _redirect_download(storage.download_url(*_download_url_args(file)))
 
-    response = StreamingHttpResponse(
-        stream.chunks(),  # stream chunks from Azure
-        content_type="application/octet-stream"
+    if response is None and ranges is None:
+        # Local storage answers with a FileResponse the server can sendfile()
+        response = storage.download_response(file.blob_name, file.blob_name, file.content_type)
+        response["Content-Length"] = file.size
+    elif response is None and len(ranges) == 1:
+        start, end = ranges[0]
+        response = _single_range_response(file, start, end, storage.open(file.blob_name, start, end - start + 1))
+    elif response is None:
+        layout = _multipart_layout(file, ranges)
+
+        def parts():
+            for head, (start, end) in zip(layout.heads, ranges):
+                yield head
+                yield from storage.open(file.blob_name, start, end - start + 1)
+                yield b"\r\n"
+            yield layout.tail
+
+        response = _multipart_response(layout, parts())
+
+    return _finish_download(response, file)
+
+
+async def adownload_file(**kwargs):
+    request, storage, file = kwargs["request"], kwargs["storage"], kwargs["file"]
+
+    response, ranges = _plan_download(request, storage, file)
+    if response is _REDIRECT:
+        url = await sync_to_async(storage.download_url, thread_sensitive=False)(*_download_url_args(file))
+        return _redirect_download(url)
+
+    if response is None and ranges is None:
+        response = StreamingHttpResponse(await storage.aopen(file.blob_name), content_type=file.content_type)
+        response["Content-Length"] = file.size
+    elif response is None and len(ranges) == 1:
+        start, end = ranges[0]
+        chunks = await storage.aopen(file.blob_name, start, end - start + 1)
+        response = _single_range_response(file, start, end, chunks)
+    elif response is None:
+        layout = _multipart_layout(file, ranges)
+
+        async def parts():
+            for head, (start, end) in zip(layout.heads, ranges):
+                yield head
+                async for chunk in await storage.aopen(file.blob_name, start, end - start + 1):
+                    yield chunk
+                yield b"\r\n"
+            yield layout.tail
+
+        response = _multipart_response(layout, parts())
+
+    return _finish_download(response, file)
+
+
+_REDIRECT = object()
+
+
+def _plan_download(request: HttpRequest, storage, file: File):
+    """
+    Conditional, redirect and Range handling shared by the sync and async
+    downloads. Returns (response, None) when the answer needs no body from
+    storage, (_REDIRECT, None) to hand the transfer to storage, or
+    (None, ranges) where ranges is None for the whole file.
+    """
+    # Revalidation of a cached copy: 304/412 from the blob's ETag
+    response = get_conditional_response(
+        request, etag=file.etag or None, last_modified=int(file.modified_at.timestamp())
+    )
+    if response is not None:
+        return response, None
+
+    if _redirects_downloads(request, storage):
+        return _REDIRECT, None
+
+    if "Range" in request.headers and if_range_matches(request.headers.get("If-Range"), file.etag, file.modified_at):
+        try:
+            return None, parse_range_header(request.headers["Range"], file.size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{file.size}"
+            return response, None
+    return None, None
+
+
+def _finish_download(response, file: File):
+    if response.status_code != 412:
+        if file.etag:
+            response["ETag"] = file.etag
+        response["Last-Modified"] = http_date(file.modified_at.timestamp())
+        response["Accept-Ranges"] = "bytes"
+        response["Cache-Control"] = "private, no-cache"
+    if response.status_code in (200, 206):
+        response["Content-Disposition"] = f'attachment; filename="{file.blob_name}"'
+        if file.content_md5 and response.status_code == 200:
+            response["Content-MD5"] = file.content_md5
+    return response
+
+
+def _redirects_downloads(request: HttpRequest, storage) -> bool:
+    """DOWNLOAD_MODE "redirect" answers 302 to a signed URL; ?proxy=1 opts out per request."""
+    return (
+        settings.DOWNLOAD_MODE == "redirect"
+        and storage.supports_signed_urls
+        and request.GET.get("proxy") not in ("1", "true")
     )
-    response["Content-Disposition"] = f'attachment; filename="{kwargs["filename"]}"'
 
+
+def _download_url_args(file: File) -> tuple:
+    expiry = datetime.now(tz=timezone.utc) + timedelta(seconds=settings.DOWNLOAD_SAS_TTL)
+    return file.blob_name, file.blob_name, file.content_type, expiry
+
+
+def _redirect_download(url: str) -> HttpResponseRedirect:
+    # Hand the transfer to storage instead of holding a worker for it
+    response = HttpResponseRedirect(url)
+    response["Cache-Control"] = "private, no-store"
+    return response
+
+
+def _single_range_response(file: File, start: int, end: int, chunks) -> StreamingHttpResponse:
+    response = StreamingHttpResponse(chunks, status=206, content_type=file.content_type)
+    response["Content-Range"] = f"bytes {start}-{end}/{file.size}"
+    response["Content-Length"] = end - start + 1
+    return response
+
+
+@dataclass
+class _MultipartLayout:
+    boundary: str
+    heads: list[bytes]
+    tail: bytes
+    length: int
+
+
+def _multipart_layout(file: File, ranges: list[tuple[int, int]]) -> _MultipartLayout:
+    """Part headers of a multipart/byteranges body, known up front so Content-Length is exact."""
+    boundary = uuid.uuid4().hex
+    heads = [
+        f"--{boundary}\r\nContent-Type: {file.content_type}\r\n"
+        f"Content-Range: bytes {start}-{end}/{file.size}\r\n\r\n".encode()
+        for start, end in ranges
+    ]
+    tail = f"--{boundary}--\r\n".encode()
+    length = len(tail) + sum(
+        len(head) + end - start + 1 + len(b"\r\n") for head, (start, end) in zip(heads, ranges)
+    )
+    return _MultipartLayout(boundary, heads, tail, length)
+
+
+def _multipart_response(layout: _MultipartLayout, parts) -> StreamingHttpResponse:
+    response = StreamingHttpResponse(
+        parts, status=206, content_type=f"multipart/byteranges; boundary={layout.boundary}"
+    )
+    response["Content-Length"] = layout.length
     return response
 
 
 def delete_file(**kwargs):
-    kwargs["blob_client"].delete_blob()
-    kwargs["file"].delete()
+    kwargs["storage"].delete(kwargs["file"].blob_name)
+    _delete_file_row(kwargs["file"])
     return JsonResponse({"message": "success"})
 
 
+async def adelete_file(**kwargs):
+    await kwargs["storage"].adelete(kwargs["file"].blob_name)
+    await sync_to_async(_delete_file_row)(kwargs["file"])
+    return JsonResponse({"message": "success"})
+
 
+def _delete_file_row(file: File) -> None:
+    with transaction.atomic():
+        file.delete()
+        remove_file_usage(file.folder, file.size)
@@ -0,0 +1,36 @@
+from functools import wraps
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.http import JsonResponse, HttpRequest
+from core.services.jwt import authenticate_access_token
+
+
+def jwt_required(view):
+    """
+    Authenticate the request from its access_token cookie.
+    The token is decoded once and the resolved User is attached
+    to the request as `request.principal`. Works on sync and async views.
+    """
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request: HttpRequest, *args, **kwargs):
+            token = request.COOKIES.get("access_token")
+            user = await sync_to_async(authenticate_access_token)(token) if token else None
+            if user is None:
+                return JsonResponse({"error": "Unauthorized"}, status=401)
+
+            request.principal = user
+            return await view(request, *args, **kwargs)
+
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request: HttpRequest, *args, **kwargs):
+        token = request.COOKIES.get("access_token")
+        user = authenticate_access_token(token) if token else None
+        if user is None:
+            return JsonResponse({"error": "Unauthorized"}, status=401)
+
+        request.principal = user
+        return view(request, *args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,34 @@
+from datetime import datetime, timedelta, timezone
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from core.models import BlobDeletion, FolderDeletion
+from core.services.folder_deletion import process_folder_deletion
+
+
+class Command(BaseCommand):
+    help = "Finish deleting the blobs of deleted folders, e.g. after a restart interrupted the background worker."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--retry-failed", action="store_true", help="also retry deletions that ran out of attempts"
+        )
+        parser.add_argument(
+            "--stale-minutes",
+            type=int,
+            default=10,
+            help="only resume pending deletions that made no progress for this long; newer ones may have a live worker",
+        )
+
+    def handle(self, *args, **options):
+        stale = datetime.now(tz=timezone.utc) - timedelta(minutes=options["stale_minutes"])
+        resumable = Q(status=FolderDeletion.STATUS_PENDING, updated_at__lt=stale)
+        if options["retry_failed"]:
+            resumable |= Q(status=FolderDeletion.STATUS_FAILED)
+
+        for deletion in FolderDeletion.objects.filter(resumable).order_by("created_at"):
+            BlobDeletion.objects.filter(deletion=deletion).update(attempts=0)
+            process_folder_deletion(deletion.id)
+            deletion.refresh_from_db()
+            self.stdout.write(
+                f"{deletion.id}: {deletion.status}, {deletion.deleted_blobs}/{deletion.total_blobs} blobs deleted"
+            )
@@ -0,0 +1,140 @@
+import csv
+import json
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from pathlib import Path
+import django
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from core.models import User, Folder, FolderPermission, FolderClosure
+
+
+def _init_worker():
+    # Spawned workers start without app registry.
+    django.setup()
+
+
+def _read_records(path: Path, fmt: str):
+    with path.open(newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            for row in csv.DictReader(f):
+                yield row.get("username"), row.get("password")
+        else:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    row = None
+                if not isinstance(row, dict):
+                    yield None, None  # counted as an invalid row
+                    continue
+                yield row.get("username"), row.get("password")
+
+
+class Command(BaseCommand):
+    help = "Create users in bulk from a CSV (username,password) or JSONL file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", type=Path)
+        parser.add_argument("--format", choices=["csv", "jsonl"], default=None, help="defaults to file extension")
+        parser.add_argument("--batch-size", type=int, default=1000, help="users hashed and inserted per batch")
+        parser.add_argument("--workers", type=int, default=None, help="password hashing processes")
+        parser.add_argument(
+            "--folder-name", default=None, help="also create an owned folder with this name for every user"
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        if not path.is_file():
+            raise CommandError(f"{path} does not exist")
+        fmt = options["format"] or ("jsonl" if path.suffix in (".jsonl", ".ndjson") else "csv")
+
+        folder_name = options["folder_name"]
+        if folder_name is not None and not folder_name.strip():
+            raise CommandError("Folder name cannot be empty.")
+        if folder_name is not None and len(folder_name) > Folder._meta.get_field("name").max_length:
+            raise CommandError("Folder name is too long.")
+
+        created = 0
+        duplicates = []
+        invalid = 0
+        started = time.monotonic()
+        records = _read_records(path, fmt)
+
+        with ProcessPoolExecutor(max_workers=options["workers"], initializer=_init_worker) as pool:
+            while batch := list(islice(records, options["batch_size"])):
+                batch, skipped = self._deduplicate(batch, duplicates)
+                invalid += skipped
+                if not batch:
+                    continue
+
+                hashes = pool.map(make_password, [password for _, password in batch], chunksize=16)
+                users = [
+                    User(id=uuid.uuid4(), username=username, password_hash=password_hash)
+                    for (username, _), password_hash in zip(batch, hashes)
+                ]
+                created += self._insert(users, folder_name, duplicates)
+
+        elapsed = time.monotonic() - started
+        for username in duplicates:
+            self.stderr.write(f"duplicate username: {username}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Created {created} users, {len(duplicates)} duplicates, {invalid} invalid rows ({elapsed:.2f}s)"
+            )
+        )
+
+    def _deduplicate(self, batch: list, duplicates: list) -> tuple[list, int]:
+        """Drop invalid rows and usernames already in the batch or database."""
+        # bulk_create(ignore_conflicts=True) is INSERT IGNORE on MySQL, which
+        # would silently truncate an overlong username instead of failing.
+        max_length = User._meta.get_field("username").max_length
+        valid = [
+            (username, password)
+            for username, password in batch
+            if isinstance(username, str) and isinstance(password, str)
+            and username and password and len(username) <= max_length
+        ]
+        existing = set(
+            User.objects.filter(username__in=[username for username, _ in valid]).values_list("username", flat=True)
+        )
+
+        unique = []
+        for username, password in valid:
+            if username in existing:
+                duplicates.append(username)
+                continue
+            existing.add(username)
+            unique.append((username, password))
+        return unique, len(batch) - len(valid)
+
+    def _insert(self, users: list[User], folder_name, duplicates: list) -> int:
+        with transaction.atomic():
+            User.objects.bulk_create(users, ignore_conflicts=True)
+
+            # Rows lost to a concurrent insert of the same username are ignored
+            # by bulk_create; look up which of our ids actually landed.
+            inserted = set(User.objects.filter(id__in=[user.id for user in users]).values_list("id", flat=True))
+            duplicates.extend(user.username for user in users if user.id not in inserted)
+            owners = [user for user in users if user.id in inserted]
+
+            if folder_name is not None:
+                folders = Folder.objects.bulk_create([Folder(name=folder_name, owner=owner) for owner in owners])
+                FolderClosure.objects.bulk_create(
+                    [FolderClosure(ancestor=folder, descendant=folder, depth=0) for folder in folders]
+                )
+                FolderPermission.objects.bulk_create(
+                    [
+                        FolderPermission(
+                            folder=folder, user=folder.owner, can_read=True, can_upload=True, can_delete=True
+                        )
+                        for folder in folders
+                    ]
+                )
+
+        return len(owners)
@@ -0,0 +1,37 @@
+from datetime import datetime, timezone
+from django.core.management.base import BaseCommand
+from core.models import PendingUpload
+from core.services.storage import BlobNotFound, get_storage
+
+
+class Command(BaseCommand):
+    help = "Delete expired uploads that were never completed, including any blob or chunks already written."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        purged = 0
+        storage = get_storage()
+        while True:
+            expired = list(
+                PendingUpload.objects.filter(expires_at__lt=datetime.now(tz=timezone.utc))
+                .order_by("expires_at")
+                .values_list("id", "name", "chunk_size")[: options["batch_size"]]
+            )
+            if not expired:
+                break
+
+            for upload_id, name, chunk_size in expired:
+                if chunk_size:
+                    storage.discard_blocks(f"{upload_id}_{name}")
+                try:
+                    storage.delete(f"{upload_id}_{name}")
+                except BlobNotFound:
+                    pass
+            purged += PendingUpload.objects.filter(id__in=[upload_id for upload_id, _, _ in expired]).delete()[0]
+
+            if len(expired) < options["batch_size"]:
+                break
+
+        self.stdout.write(self.style.SUCCESS(f"Purged {purged} expired pending uploads"))
@@ -0,0 +1,45 @@
+import time
+from datetime import datetime, timedelta, timezone
+from django.core.management.base import BaseCommand
+from core.models import RefreshToken
+
+
+class Command(BaseCommand):
+    help = "Delete expired refresh tokens in bounded, throttled batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="rows deleted per statement")
+        parser.add_argument("--sleep", type=float, default=0.1, help="seconds to pause between batches")
+        parser.add_argument(
+            "--grace-minutes", type=int, default=0, help="only purge tokens expired for at least this long"
+        )
+        parser.add_argument("--max-batches", type=int, default=None, help="stop after this many batches")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        cutoff = datetime.now(tz=timezone.utc) - timedelta(minutes=options["grace_minutes"])
+        expired = RefreshToken.objects.filter(expires_at__lt=cutoff).order_by("expires_at")
+
+        purged = 0
+        batches = 0
+        started = time.monotonic()
+
+        while options["max_batches"] is None or batches < options["max_batches"]:
+            # Select primary keys first so each DELETE only locks a bounded
+            # set of rows found through the expires_at index.
+            jtis = list(expired.values_list("jti", flat=True)[:batch_size])
+            if not jtis:
+                break
+
+            deleted, _ = RefreshToken.objects.filter(jti__in=jtis).delete()
+            purged += deleted
+            batches += 1
+
+            if len(jtis) < batch_size:
+                break
+            time.sleep(options["sleep"])
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(f"Purged {purged} refresh tokens in {batches} batches ({elapsed:.2f}s)")
+        )
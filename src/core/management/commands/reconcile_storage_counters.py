@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from core.models import User, Folder, File
+
+
+def _actual_totals(owner_lookup: str):
+    """File count and bytes of the rows whose `owner_lookup` is the outer row, as subqueries."""
+    files = File.objects.filter(**{owner_lookup: OuterRef("pk")}).order_by().values(owner_lookup)
+    return (
+        Coalesce(Subquery(files.annotate(total=Count("id")).values("total")), 0),
+        Coalesce(Subquery(files.annotate(total=Sum("size")).values("total")), 0),
+    )
+
+
+class Command(BaseCommand):
+    help = "Recompute folder and user storage counters from File rows and repair drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="report drift without fixing it")
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        # Users are counted from File rows too rather than from the folder
+        # counters, so --dry-run reports the same drift a real run repairs.
+        fixed_folders = self._repair(Folder, "folder", options)
+        fixed_users = self._repair(User, "folder__owner", options)
+
+        verb = "Found" if options["dry_run"] else "Repaired"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {fixed_folders} folders and {fixed_users} users with drifted counters"))
+
+    def _repair(self, model, owner_lookup: str, options) -> int:
+        actual_count, actual_bytes = _actual_totals(owner_lookup)
+        drifted = model.objects.annotate(actual_count=actual_count, actual_bytes=actual_bytes).exclude(
+            file_count=F("actual_count"), total_bytes=F("actual_bytes")
+        )
+        ids = list(drifted.values_list("id", flat=True))
+        if options["dry_run"]:
+            return len(ids)
+
+        # The totals are recomputed inside the UPDATE itself, so an upload or
+        # delete that changed the counters since the read above is not lost.
+        batch_size = options["batch_size"]
+        for i in range(0, len(ids), batch_size):
+            model.objects.filter(id__in=ids[i:i + batch_size]).update(file_count=actual_count, total_bytes=actual_bytes)
+        return len(ids)
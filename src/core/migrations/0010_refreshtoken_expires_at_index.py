@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-18 07:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0009_alter_folderpermission_folder"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="refreshtoken",
+            name="expires_at",
+            field=models.DateTimeField(db_index=True),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 6.0.1 on 2026-10-18 07:26
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    File = apps.get_model("core", "File")
+    Folder = apps.get_model("core", "Folder")
+    User = apps.get_model("core", "User")
+
+    files = File.objects.filter(folder=OuterRef("pk")).values("folder")
+    Folder.objects.update(
+        file_count=Coalesce(Subquery(files.annotate(n=Count("id")).values("n")), 0),
+        total_bytes=Coalesce(Subquery(files.annotate(n=Sum("size")).values("n")), 0),
+    )
+
+    folders = Folder.objects.filter(owner=OuterRef("pk")).values("owner")
+    User.objects.update(
+        file_count=Coalesce(Subquery(folders.annotate(n=Sum("file_count")).values("n")), 0),
+        total_bytes=Coalesce(Subquery(folders.annotate(n=Sum("total_bytes")).values("n")), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0010_refreshtoken_expires_at_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="folder",
+            name="file_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="folder",
+            name="total_bytes",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="file_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="total_bytes",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
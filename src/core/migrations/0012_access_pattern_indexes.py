@@ -0,0 +1,61 @@
+# Generated by Django 6.0.1 on 2026-10-18 07:27
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def remove_duplicates(apps, schema_editor):
+    """Make existing rows satisfy the new unique constraints."""
+    Folder = apps.get_model("core", "Folder")
+    FolderPermission = apps.get_model("core", "FolderPermission")
+
+    duplicated = (
+        FolderPermission.objects.values("folder_id", "user_id").annotate(n=Count("id")).filter(n__gt=1)
+    )
+    for row in duplicated:
+        perms = FolderPermission.objects.filter(folder_id=row["folder_id"], user_id=row["user_id"]).order_by("id")
+        FolderPermission.objects.filter(id__in=[p.id for p in perms[1:]]).delete()
+
+    duplicated = Folder.objects.values("owner_id", "name").annotate(n=Count("id")).filter(n__gt=1)
+    for row in duplicated:
+        folders = Folder.objects.filter(owner_id=row["owner_id"], name=row["name"]).order_by("id")
+        suffix = 1
+        for folder in list(folders[1:]):
+            # skip suffixes the owner already uses, compared in the database's collation
+            while True:
+                suffix += 1
+                name = f"{folder.name[:240]} ({suffix})"
+                if not Folder.objects.filter(owner_id=row["owner_id"], name=name).exists():
+                    break
+            folder.name = name
+            folder.save(update_fields=["name"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0011_storage_counters"),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="file",
+            index=models.Index(fields=["folder", "name", "id", "size"], name="idx_file_folder_name"),
+        ),
+        migrations.AddIndex(
+            model_name="folderpermission",
+            index=models.Index(
+                fields=["user", "can_read", "folder", "can_upload", "can_delete"],
+                name="idx_folderperm_user_read",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="folder",
+            constraint=models.UniqueConstraint(fields=("owner", "name"), name="uniq_folder_owner_name"),
+        ),
+        migrations.AddConstraint(
+            model_name="folderpermission",
+            constraint=models.UniqueConstraint(fields=("folder", "user"), name="uniq_folder_permission"),
+        ),
+    ]
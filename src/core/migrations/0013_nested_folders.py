@@ -0,0 +1,81 @@
+# Generated by Django 6.0.1 on 2026-10-18 07:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_self_links(apps, schema_editor):
+    Folder = apps.get_model("core", "Folder")
+    FolderClosure = apps.get_model("core", "FolderClosure")
+
+    FolderClosure.objects.bulk_create(
+        (FolderClosure(ancestor_id=folder_id, descendant_id=folder_id, depth=0)
+         for folder_id in Folder.objects.values_list("id", flat=True).iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0012_access_pattern_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="folder",
+            name="parent",
+            field=models.ForeignKey(
+                blank=True,
+                db_column="parent_id",
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="children",
+                to="core.folder",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="folder",
+            constraint=models.UniqueConstraint(
+                fields=("owner", "parent", "name"), name="uniq_folder_owner_parent_name"
+            ),
+        ),
+        migrations.RemoveConstraint(
+            model_name="folder",
+            name="uniq_folder_owner_name",
+        ),
+        migrations.CreateModel(
+            name="FolderClosure",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                ("depth", models.PositiveIntegerField()),
+                (
+                    "ancestor",
+                    models.ForeignKey(
+                        db_column="ancestor_id",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="descendant_links",
+                        to="core.folder",
+                    ),
+                ),
+                (
+                    "descendant",
+                    models.ForeignKey(
+                        db_column="descendant_id",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="ancestor_links",
+                        to="core.folder",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(fields=("ancestor", "descendant"), name="uniq_folder_closure"),
+                ],
+                "indexes": [
+                    models.Index(fields=["descendant", "depth"], name="idx_folder_closure_descendant"),
+                ],
+            },
+        ),
+        migrations.RunPython(create_self_links, migrations.RunPython.noop),
+    ]
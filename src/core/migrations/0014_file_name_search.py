@@ -0,0 +1,28 @@
+# Generated by Django 6.0.1 on 2026-10-18 07:34
+
+from django.db import migrations, models
+
+
+def create_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "mysql":
+        schema_editor.execute("ALTER TABLE core_file ADD FULLTEXT INDEX ft_file_name (name) WITH PARSER ngram")
+
+
+def drop_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "mysql":
+        schema_editor.execute("ALTER TABLE core_file DROP INDEX ft_file_name")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0013_nested_folders"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="file",
+            index=models.Index(fields=["name", "id"], name="idx_file_name"),
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
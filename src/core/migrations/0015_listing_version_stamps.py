@@ -0,0 +1,23 @@
+# Generated by Django 6.0.1 on 2026-10-18 07:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0014_file_name_search"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="folder",
+            name="version",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="folders_version",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-18 07:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0016_pendingupload"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="pendingupload",
+            name="chunk_size",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 6.0.1 on 2026-10-18 07:52
+
+import django.utils.timezone
+import mimetypes
+from django.db import migrations, models
+
+
+def backfill_blob_metadata(apps, schema_editor):
+    File = apps.get_model("core", "File")
+
+    batch = []
+    for file in File.objects.only("id", "name").iterator(chunk_size=2000):
+        file.blob_name = f"{file.id}_{file.name}"
+        file.content_type = mimetypes.guess_type(file.name)[0] or "application/octet-stream"
+        batch.append(file)
+        if len(batch) == 2000:
+            File.objects.bulk_update(batch, ["blob_name", "content_type"])
+            batch = []
+    File.objects.bulk_update(batch, ["blob_name", "content_type"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0017_pendingupload_chunk_size"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="file",
+            name="blob_name",
+            field=models.CharField(default="", max_length=300),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="file",
+            name="content_type",
+            field=models.CharField(default="application/octet-stream", max_length=255),
+        ),
+        migrations.AddField(
+            model_name="file",
+            name="etag",
+            field=models.CharField(blank=True, default="", max_length=64),
+        ),
+        migrations.AddField(
+            model_name="file",
+            name="content_md5",
+            field=models.CharField(blank=True, default="", max_length=24),
+        ),
+        migrations.AddField(
+            model_name="file",
+            name="created_at",
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="file",
+            name="modified_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_blob_metadata, migrations.RunPython.noop),
+    ]
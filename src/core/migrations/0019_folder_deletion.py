@@ -0,0 +1,61 @@
+# Generated by Django 6.0.1 on 2026-10-18 07:56
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0018_file_blob_metadata"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FolderDeletion",
+            fields=[
+                ("id", models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ("folder_id", models.UUIDField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("pending", "Pending"), ("done", "Done"), ("failed", "Failed")],
+                        default="pending",
+                        max_length=16,
+                    ),
+                ),
+                ("total_blobs", models.PositiveIntegerField(default=0)),
+                ("deleted_blobs", models.PositiveIntegerField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        db_column="user_id",
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="folder_deletions",
+                        to="core.user",
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="BlobDeletion",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                ("blob_name", models.CharField(max_length=300)),
+                ("attempts", models.PositiveSmallIntegerField(default=0)),
+                (
+                    "deletion",
+                    models.ForeignKey(
+                        db_column="deletion_id",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="blobs",
+                        to="core.folderdeletion",
+                    ),
+                ),
+            ],
+        ),
+    ]
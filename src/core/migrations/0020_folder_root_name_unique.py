@@ -0,0 +1,51 @@
+# Generated by Django 6.0.1 on 2026-10-18 08:04
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def rename_duplicate_roots(apps, schema_editor):
+    """Root folders were only unique per owner in application code; make them satisfy the constraint."""
+    Folder = apps.get_model("core", "Folder")
+
+    duplicated = (
+        Folder.objects.filter(parent__isnull=True).values("owner_id", "name").annotate(n=Count("id")).filter(n__gt=1)
+    )
+    for row in duplicated:
+        folders = Folder.objects.filter(owner_id=row["owner_id"], parent__isnull=True, name=row["name"]).order_by("id")
+        suffix = 1
+        for folder in list(folders[1:]):
+            while True:
+                suffix += 1
+                name = f"{folder.name[:240]} ({suffix})"
+                if not Folder.objects.filter(owner_id=row["owner_id"], parent__isnull=True, name=name).exists():
+                    break
+            folder.name = name
+            folder.save(update_fields=["name"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0019_folder_deletion"),
+    ]
+
+    operations = [
+        migrations.RunPython(rename_duplicate_roots, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="folder",
+            constraint=models.UniqueConstraint(
+                models.F("owner"),
+                django.db.models.functions.comparison.Coalesce(
+                    "parent", models.Value(""), output_field=models.CharField()
+                ),
+                models.F("name"),
+                name="uniq_folder_sibling_name",
+            ),
+        ),
+        migrations.RemoveConstraint(
+            model_name="folder",
+            name="uniq_folder_owner_parent_name",
+        ),
+    ]
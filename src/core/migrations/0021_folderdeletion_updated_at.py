@@ -0,0 +1,20 @@
+# Generated by Django 6.0.1 on 2026-10-18 08:20
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0020_folder_root_name_unique"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="folderdeletion",
+            name="updated_at",
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -1,5 +1,7 @@
 import uuid
 from django.db import models
+from django.db.models import Value
+from django.db.models.functions import Coalesce
 from django.contrib import admin
 
 
@@ -9,18 +11,23 @@ class User(models.Model):
     password_hash = models.CharField(max_length=255)
     token_version = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
+    # rollup of the counters of all folders owned by the user
+    file_count = models.PositiveIntegerField(default=0)
+    total_bytes = models.PositiveBigIntegerField(default=0)
+    # bumped whenever the user's /folders listing may change
+    folders_version = models.PositiveBigIntegerField(default=0)
 
 
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
-    list_display = ("id", "username", "created_at")
+    list_display = ("id", "username", "created_at", "file_count", "total_bytes")
 
 
 class RefreshToken(models.Model):
     jti = models.UUIDField(primary_key=True, editable=False, default=uuid.uuid4)
     user = models.ForeignKey(User, on_delete=models.CASCADE, db_column="user_id", related_name="refresh_tokens")
     issued_at = models.DateTimeField(auto_now_add=True)
-    expires_at = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)
     revoked_at = models.DateTimeField(null=True, blank=True)
 
 
@@ -33,11 +40,53 @@ class Folder(models.Model):
     id = models.UUIDField(primary_key=True, editable=False, default=uuid.uuid4)
     name = models.CharField(max_length=255)
     owner = models.ForeignKey(User, on_delete=models.CASCADE, db_column="owner_id", related_name="folders")
+    parent = models.ForeignKey(
+        "self", on_delete=models.CASCADE, db_column="parent_id", related_name="children", null=True, blank=True
+    )
+    file_count = models.PositiveIntegerField(default=0)
+    total_bytes = models.PositiveBigIntegerField(default=0)
+    # bumped whenever the folder's file listing changes
+    version = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # NULL parents count as distinct in a plain unique index, so root
+            # folders are keyed on an empty parent instead (functional key part)
+            models.UniqueConstraint(
+                "owner",
+                Coalesce("parent", Value(""), output_field=models.CharField()),
+                "name",
+                name="uniq_folder_sibling_name",
+            ),
+        ]
 
 
 @admin.register(Folder)
 class FolderAdmin(admin.ModelAdmin):
-    list_display = ("id", "name", "owner")
+    list_display = ("id", "name", "owner", "parent", "file_count", "total_bytes")
+
+
+class FolderClosure(models.Model):
+    """
+    One row per (ancestor, descendant) pair of the folder tree, including
+    each folder paired with itself at depth 0.
+    """
+    id = models.BigAutoField(primary_key=True)
+    ancestor = models.ForeignKey(
+        Folder, on_delete=models.CASCADE, db_column="ancestor_id", related_name="descendant_links"
+    )
+    descendant = models.ForeignKey(
+        Folder, on_delete=models.CASCADE, db_column="descendant_id", related_name="ancestor_links"
+    )
+    depth = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["ancestor", "descendant"], name="uniq_folder_closure"),
+        ]
+        indexes = [
+            models.Index(fields=["descendant", "depth"], name="idx_folder_closure_descendant"),
+        ]
 
 
 class File(models.Model):
@@ -45,11 +94,106 @@ class File(models.Model):
     name = models.CharField(max_length=255)
     folder = models.ForeignKey(Folder, on_delete=models.CASCADE, db_column="folder_id", related_name="files")
     size = models.PositiveIntegerField()
+    # Blob metadata recorded at upload, so downloads need no storage probe.
+    # etag and content_md5 are empty for files uploaded before they existed;
+    # content_md5 is also empty for resumable uploads to Azure, whose chunks
+    # arrive in any order and are never hashed as a whole.
+    blob_name = models.CharField(max_length=300)
+    content_type = models.CharField(max_length=255, default="application/octet-stream")
+    etag = models.CharField(max_length=64, blank=True, default="")
+    content_md5 = models.CharField(max_length=24, blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    modified_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # covers the folder listing ordered by (name, id)
+            models.Index(fields=["folder", "name", "id", "size"], name="idx_file_folder_name"),
+            # prefix search across folders; substring search uses the
+            # ft_file_name FULLTEXT ngram index created in migration 0014
+            models.Index(fields=["name", "id"], name="idx_file_name"),
+        ]
 
 
 @admin.register(File)
 class FileAdmin(admin.ModelAdmin):
-    list_display = ("id", "name", "folder", "size")
+    list_display = ("id", "name", "folder", "size", "content_type", "created_at")
+
+
+class PendingUpload(models.Model):
+    """
+    An upload that was authorised but not yet completed: either a direct
+    upload to a signed URL or, when chunk_size is set, a resumable upload
+    whose chunks are staged as blocks of the blob. Its id becomes the File
+    id once the client completes the upload.
+    """
+    id = models.UUIDField(primary_key=True, editable=False, default=uuid.uuid4)
+    name = models.CharField(max_length=255)
+    folder = models.ForeignKey(Folder, on_delete=models.CASCADE, db_column="folder_id", related_name="pending_uploads")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_column="user_id", related_name="pending_uploads")
+    size = models.PositiveIntegerField()
+    content_type = models.CharField(max_length=255)
+    chunk_size = models.PositiveIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    @property
+    def blob_name(self) -> str:
+        return f"{self.id}_{self.name}"
+
+    @property
+    def chunk_count(self) -> int:
+        return -(-self.size // self.chunk_size)
+
+    def chunk_length(self, index: int) -> int:
+        return min(self.chunk_size, self.size - index * self.chunk_size)
+
+
+@admin.register(PendingUpload)
+class PendingUploadAdmin(admin.ModelAdmin):
+    list_display = ("id", "name", "folder", "user", "size", "chunk_size", "expires_at")
+
+
+class FolderDeletion(models.Model):
+    """
+    A deleted folder subtree. Its rows are gone; its blobs are queued as
+    BlobDeletion rows and removed from storage by a background worker.
+    """
+    STATUS_PENDING = "pending"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+
+    id = models.UUIDField(primary_key=True, editable=False, default=uuid.uuid4)
+    folder_id = models.UUIDField()
+    user = models.ForeignKey(
+        User, on_delete=models.SET_NULL, db_column="user_id", related_name="folder_deletions", null=True
+    )
+    status = models.CharField(
+        max_length=16,
+        default=STATUS_PENDING,
+        choices=[(STATUS_PENDING, "Pending"), (STATUS_DONE, "Done"), (STATUS_FAILED, "Failed")],
+    )
+    total_blobs = models.PositiveIntegerField(default=0)
+    deleted_blobs = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # set after every batch, so process_blob_deletions can tell a live worker from a dead one
+    updated_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+
+@admin.register(FolderDeletion)
+class FolderDeletionAdmin(admin.ModelAdmin):
+    list_display = ("id", "folder_id", "user", "status", "total_blobs", "deleted_blobs", "created_at")
+
+
+class BlobDeletion(models.Model):
+    """A blob still to be deleted for a FolderDeletion; the row goes once the blob does."""
+    id = models.BigAutoField(primary_key=True)
+    deletion = models.ForeignKey(
+        FolderDeletion, on_delete=models.CASCADE, db_column="deletion_id", related_name="blobs"
+    )
+    blob_name = models.CharField(max_length=300)
+    attempts = models.PositiveSmallIntegerField(default=0)
 
 
 class FolderPermission(models.Model):
@@ -62,6 +206,17 @@ class FolderPermission(models.Model):
     can_upload = models.BooleanField(default=False)
     can_delete = models.BooleanField(default=False)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["folder", "user"], name="uniq_folder_permission"),
+        ]
+        indexes = [
+            # covers get_available_folders: filter on (user, can_read), join on folder
+            models.Index(
+                fields=["user", "can_read", "folder", "can_upload", "can_delete"], name="idx_folderperm_user_read"
+            ),
+        ]
+
 
 @admin.register(FolderPermission)
 class FolderPermissionAdmin(admin.ModelAdmin):
@@ -1,29 +1,33 @@
 from django.contrib.auth.hashers import check_password
 from core.models import User
+from core.services.hashing import hashing_pool
 from django.db import IntegrityError
 from django.contrib.auth.hashers import make_password
 import uuid
 from typing import Optional
 
-def verify_user_credentials(username: str, password: str) -> Optional[User]:
+# Password hashing runs on hashing_pool and raises HashingPoolBusy when
+# the pool is saturated; views translate that into 503 Retry-After.
+
+async def averify_user_credentials(username: str, password: str) -> Optional[User]:
     try:
-        user = User.objects.get(username=username)
+        user = await User.objects.aget(username=username)
     except User.DoesNotExist:
         return None
 
-    if check_password(password, user.password_hash):
+    if await hashing_pool.arun(check_password, password, user.password_hash):
         return user
     return None
 
 
-def create_user(username: str, password: str) -> Optional[User]:
+async def acreate_user(username: str, password: str) -> Optional[User]:
     try:
         user = User(
             id=uuid.uuid4(),
             username=username,
-            password_hash=make_password(password)
+            password_hash=await hashing_pool.arun(make_password, password)
         )
-        user.save()
+        await user.asave()
         return user
     except IntegrityError:
         return None
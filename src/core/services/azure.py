@@ -0,0 +1,87 @@
+import asyncio
+import functools
+import threading
+import weakref
+from datetime import datetime, timedelta, timezone
+from azure.identity import ManagedIdentityCredential
+from azure.identity.aio import ManagedIdentityCredential as AsyncManagedIdentityCredential
+from azure.storage.blob import (
+    BlobClient,
+    BlobSasPermissions,
+    BlobServiceClient,
+    ContainerClient,
+    UserDelegationKey,
+    generate_blob_sas,
+)
+from azure.storage.blob.aio import BlobClient as AsyncBlobClient, BlobServiceClient as AsyncBlobServiceClient
+from django.conf import settings
+
+# The app authenticates with a managed identity, so SAS tokens are signed
+# with a user delegation key. Fetching one is a round trip to Azure AD and
+# storage, so a key is reused until shortly before it expires.
+_DELEGATION_KEY_LIFETIME = timedelta(hours=1)
+_DELEGATION_KEY_MARGIN = timedelta(minutes=5)
+
+_delegation_key: UserDelegationKey | None = None
+_delegation_key_expiry: datetime | None = None
+_delegation_key_lock = threading.Lock()
+
+# aio clients hold an aiohttp session bound to the event loop that created it
+_async_service_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncBlobServiceClient]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+@functools.cache
+def get_blob_service_client() -> BlobServiceClient:
+    """Created on first use so importing the app needs no Azure credentials."""
+    return BlobServiceClient(account_url=settings.BLOB_ACCOUNT_URL, credential=ManagedIdentityCredential())
+
+
+def get_blob_client(blob_name: str) -> BlobClient:
+    return get_blob_service_client().get_blob_client(container=settings.BLOB_CONTAINER_NAME, blob=blob_name)
+
+
+def get_container_client() -> ContainerClient:
+    return get_blob_service_client().get_container_client(settings.BLOB_CONTAINER_NAME)
+
+
+def get_async_blob_client(blob_name: str) -> AsyncBlobClient:
+    """aio client for async views, shared by everything on the running event loop."""
+    loop = asyncio.get_running_loop()
+    service_client = _async_service_clients.get(loop)
+    if service_client is None:
+        service_client = AsyncBlobServiceClient(
+            account_url=settings.BLOB_ACCOUNT_URL, credential=AsyncManagedIdentityCredential()
+        )
+        _async_service_clients[loop] = service_client
+    return service_client.get_blob_client(container=settings.BLOB_CONTAINER_NAME, blob=blob_name)
+
+
+def get_user_delegation_key(service_client: BlobServiceClient) -> UserDelegationKey:
+    global _delegation_key, _delegation_key_expiry
+
+    now = datetime.now(tz=timezone.utc)
+    with _delegation_key_lock:
+        if _delegation_key is None or _delegation_key_expiry - now < _DELEGATION_KEY_MARGIN:
+            _delegation_key_expiry = now + _DELEGATION_KEY_LIFETIME
+            _delegation_key = service_client.get_user_delegation_key(
+                key_start_time=now - _DELEGATION_KEY_MARGIN, key_expiry_time=_delegation_key_expiry
+            )
+        return _delegation_key
+
+
+def generate_blob_url(blob_name: str, permission: BlobSasPermissions, expiry: datetime, **kwargs) -> str:
+    """URL of a single blob with a SAS granting `permission` until `expiry`."""
+    service_client = get_blob_service_client()
+    sas = generate_blob_sas(
+        account_name=service_client.account_name,
+        container_name=settings.BLOB_CONTAINER_NAME,
+        blob_name=blob_name,
+        user_delegation_key=get_user_delegation_key(service_client),
+        permission=permission,
+        expiry=expiry,
+        start=datetime.now(tz=timezone.utc) - _DELEGATION_KEY_MARGIN,
+        **kwargs,
+    )
+    return f"{get_blob_client(blob_name).url}?{sas}"
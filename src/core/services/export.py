@@ -0,0 +1,39 @@
+import json
+from typing import Iterator
+from django.conf import settings
+from core.models import File
+from core.services.pagination import keyset_page
+
+
+def export_files_ndjson(folder_ids) -> Iterator[bytes]:
+    """
+    Yield every file of the folders in `folder_ids` as one JSON object per
+    line, folder by folder.
+
+    Rows are read in keyset chunks of EXPORT_CHUNK_SIZE ordered by
+    (name, id) rather than with .iterator(): mysqlclient buffers the whole
+    result set of a query client-side, so only bounded queries keep memory
+    flat for folders of any size. Each chunk is a range read on one folder
+    of the (folder, name, id) index; paging over all the folders at once
+    would sort every file they hold for each chunk.
+    """
+    chunk_size = getattr(settings, "EXPORT_CHUNK_SIZE", 2000)
+
+    for folder_id in folder_ids:
+        files = File.objects.filter(folder_id=folder_id).values("id", "name", "size", "folder_id")
+        cursor = ""
+        while True:
+            rows, cursor = keyset_page(files, cursor, chunk_size, "name", "id")
+            if rows:
+                yield b"".join(json.dumps(serialize_export_row(row)).encode() + b"\n" for row in rows)
+            if cursor is None:
+                break
+
+
+def serialize_export_row(row: dict) -> dict:
+    return {
+        "id": str(row["id"]),
+        "name": row["name"],
+        "size": row["size"],  # exact bytes
+        "folderId": str(row["folder_id"]),
+    }
@@ -0,0 +1,123 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F, Sum
+from core.models import BlobDeletion, File, Folder, FolderClosure, FolderDeletion, FolderPermission, PendingUpload, User
+from core.services.folders_operations import lock_folder_tree
+from core.services.helpers import bump_folders_version, invalidate_subtree_permissions
+from core.services.storage import get_storage
+from core.services.usage import remove_folder_usage
+
+# Deleting a folder removes its subtree's rows in one transaction and queues
+# the blobs as BlobDeletion rows. A background thread then deletes them in
+# batches (blob batch requests on Azure), so the request returns at once.
+# The queue survives restarts: process_blob_deletions resumes it.
+
+logger = logging.getLogger(__name__)
+
+_deletion_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, "BLOB_DELETION_WORKERS", 2), thread_name_prefix="blob-deletion"
+)
+
+_QUEUE_CHUNK_SIZE = 2000
+
+
+def delete_folder(folder: Folder, user: User) -> FolderDeletion:
+    """Delete `folder` with its subfolders and files; blobs are removed in the background."""
+    with transaction.atomic():
+        lock_folder_tree(folder.owner_id)
+        subtree_ids = list(FolderClosure.objects.filter(ancestor=folder).values_list("descendant_id", flat=True))
+        usage = Folder.objects.filter(id__in=subtree_ids).aggregate(files=Sum("file_count"), bytes=Sum("total_bytes"))
+
+        # the folders drop out of the listings of the owner and everyone they were shared with
+        bump_folders_version(id=folder.owner_id)
+        bump_folders_version(id__in=FolderPermission.objects.filter(folder_id__in=subtree_ids).values("user_id"))
+
+        deletion = FolderDeletion.objects.create(folder_id=folder.id, user=user)
+        files = File.objects.filter(folder_id__in=subtree_ids).values_list("blob_name", flat=True)
+        pending_uploads = PendingUpload.objects.filter(folder_id__in=subtree_ids).values_list("id", "name")
+        total = _queue_blobs(deletion, files.iterator(chunk_size=_QUEUE_CHUNK_SIZE))
+        total += _queue_blobs(deletion, (f"{id}_{name}" for id, name in pending_uploads))
+
+        remove_folder_usage(folder.owner_id, usage["files"] or 0, usage["bytes"] or 0)
+        Folder.objects.filter(id__in=subtree_ids).delete()
+
+        deletion.total_blobs = total
+        if not total:
+            deletion.status, deletion.finished_at = FolderDeletion.STATUS_DONE, datetime.now(tz=timezone.utc)
+        deletion.save(update_fields=["total_blobs", "status", "finished_at"])
+        if total:
+            transaction.on_commit(lambda: _deletion_executor.submit(_run_in_background, deletion.id))
+
+    invalidate_subtree_permissions(subtree_ids)
+    return deletion
+
+
+def _queue_blobs(deletion: FolderDeletion, names) -> int:
+    queued, batch = 0, []
+    for name in names:
+        batch.append(BlobDeletion(deletion=deletion, blob_name=name))
+        if len(batch) == _QUEUE_CHUNK_SIZE:
+            BlobDeletion.objects.bulk_create(batch)
+            queued, batch = queued + len(batch), []
+    BlobDeletion.objects.bulk_create(batch)
+    return queued + len(batch)
+
+
+def process_folder_deletion(deletion_id) -> None:
+    """
+    Delete the queued blobs of a FolderDeletion in batches of
+    BLOB_DELETION_BATCH_SIZE. Blobs that fail are retried after
+    BLOB_DELETION_RETRY_DELAY seconds, up to BLOB_DELETION_MAX_ATTEMPTS times;
+    if any are left the deletion ends up "failed".
+    """
+    storage = get_storage()
+    batch_size = getattr(settings, "BLOB_DELETION_BATCH_SIZE", 256)
+    max_attempts = getattr(settings, "BLOB_DELETION_MAX_ATTEMPTS", 5)
+    queue = BlobDeletion.objects.filter(deletion_id=deletion_id)
+
+    while True:
+        batch = list(queue.filter(attempts__lt=max_attempts).order_by("id").values_list("id", "blob_name")[:batch_size])
+        if not batch:
+            break
+
+        failed = set(storage.delete_many([name for _, name in batch]))
+        with transaction.atomic():
+            deleted = queue.filter(id__in=[id for id, name in batch if name not in failed]).delete()[0]
+            queue.filter(id__in=[id for id, name in batch if name in failed]).update(attempts=F("attempts") + 1)
+            FolderDeletion.objects.filter(id=deletion_id).update(
+                deleted_blobs=F("deleted_blobs") + deleted, updated_at=datetime.now(tz=timezone.utc)
+            )
+
+        if failed:
+            time.sleep(getattr(settings, "BLOB_DELETION_RETRY_DELAY", 5))
+
+    FolderDeletion.objects.filter(id=deletion_id).update(
+        status=FolderDeletion.STATUS_FAILED if queue.exists() else FolderDeletion.STATUS_DONE,
+        finished_at=datetime.now(tz=timezone.utc),
+    )
+
+
+def _run_in_background(deletion_id) -> None:
+    close_old_connections()
+    try:
+        process_folder_deletion(deletion_id)
+    except Exception:
+        # left "pending"; process_blob_deletions picks it up again
+        logger.exception("Blob deletion %s failed", deletion_id)
+    finally:
+        connection.close()
+
+
+def serialize_folder_deletion(deletion: FolderDeletion) -> dict:
+    return {
+        "id": str(deletion.id),
+        "folderId": str(deletion.folder_id),
+        "status": deletion.status,
+        "totalBlobs": deletion.total_blobs,
+        "deletedBlobs": deletion.deleted_blobs,
+        "finishedAt": deletion.finished_at.isoformat() if deletion.finished_at else None,
+    }
@@ -1,8 +1,26 @@
-from core.models import Folder, User, FolderPermission
+from typing import Optional
+from core.models import Folder, User, FolderPermission, FolderClosure
+from core.services.helpers import invalidate_subtree_permissions, bump_folders_version, bump_folder_listing
 from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import QuerySet
 
+# Folders form trees owned by a single user. FolderClosure stores every
+# (ancestor, descendant, depth) pair, so subtree and ancestor lookups are
+# single indexed queries regardless of depth. Changes to the shape of a
+# tree are serialised per owner with lock_folder_tree.
 
-def create_folder_for_user(name: str, owner_id: str) -> Folder:
+
+def lock_folder_tree(owner_id) -> None:
+    """
+    Lock the owner's row until the end of the transaction. Moves, deletes
+    and nested creates read the closure table before writing it, so two of
+    them running side by side could leave a cycle or stale ancestor links.
+    """
+    User.objects.select_for_update().filter(id=owner_id).values_list("id", flat=True).first()
+
+
+def create_folder_for_user(name: str, owner_id: str, parent_id: Optional[str] = None) -> Folder:
     if not name.strip():
         raise ValidationError("Folder name cannot be empty.")
 
@@ -10,34 +28,168 @@ def create_folder_for_user(name: str, owner_id: str) -> Folder:
     if not owner:
         raise ValidationError("Invalid user ???? should never happen")
 
-    if Folder.objects.filter(name=name, owner=owner).exists():
+    parent = None
+    if parent_id is not None:
+        parent = Folder.objects.filter(id=parent_id, owner=owner).first()
+        if not parent:
+            raise ValidationError("Parent folder not found.")
+
+    if Folder.objects.filter(name=name, owner=owner, parent=parent).exists():
         raise ValidationError("A folder with this name already exists for this user.")
 
-    folder = Folder.objects.create(name=name, owner=owner)
-    FolderPermission.objects.create(folder=folder, user=owner, can_read=True, can_upload=True, can_delete=True)
+    try:
+        with transaction.atomic():
+            if parent is not None:
+                lock_folder_tree(owner.id)
+            folder = Folder.objects.create(name=name, owner=owner, parent=parent)
+            _link_to_ancestors(folder, parent)
+            # nested folders inherit permissions from the nearest ancestor grant
+            if parent is None:
+                FolderPermission.objects.create(
+                    folder=folder, user=owner, can_read=True, can_upload=True, can_delete=True
+                )
+                bump_folders_version(id=owner.id)
+    except IntegrityError:
+        # lost a race against a concurrent create of the same name
+        raise ValidationError("A folder with this name already exists for this user.")
 
     return folder
 
 
-def get_available_folders(user_id: str):
-    permissions = (
-        (FolderPermission.objects.filter(user_id=user_id, can_read=True))
-        .select_related("folder__owner")
-        .order_by("folder__name")
+def _link_to_ancestors(folder: Folder, parent: Optional[Folder]) -> None:
+    links = [FolderClosure(ancestor=folder, descendant=folder, depth=0)]
+    if parent is not None:
+        links += [
+            FolderClosure(ancestor_id=ancestor_id, descendant=folder, depth=depth + 1)
+            for ancestor_id, depth in FolderClosure.objects.filter(descendant=parent).values_list("ancestor_id", "depth")
+        ]
+    FolderClosure.objects.bulk_create(links)
+
+
+def get_subtree(folder: Folder) -> QuerySet:
+    """The folder and all its descendants, shallowest first."""
+    return (
+        FolderClosure.objects.filter(ancestor=folder)
+        .order_by("depth", "descendant__name", "descendant_id")
+        .values("descendant_id", "descendant__name", "descendant__parent_id", "depth")
     )
 
-    folders = [
-        {
-            "id": str(permission.folder.id),
-            "ownerUsername": permission.folder.owner.username,
-            "name": permission.folder.name,
-            "permissions": {
-                "read": permission.can_read,
-                "upload": permission.can_upload,
-                "delete": permission.can_delete,
-            },
-        }
-        for permission in permissions
-    ]
-
-    return folders
+
+def serialize_subtree_folder(row: dict) -> dict:
+    return {
+        "id": str(row["descendant_id"]),
+        "name": row["descendant__name"],
+        "parentId": str(row["descendant__parent_id"]) if row["descendant__parent_id"] else None,
+        "depth": row["depth"],
+    }
+
+
+def rename_folder(folder: Folder, name: str) -> None:
+    if not name.strip():
+        raise ValidationError("Folder name cannot be empty.")
+    if Folder.objects.filter(owner_id=folder.owner_id, parent_id=folder.parent_id, name=name).exclude(id=folder.id).exists():
+        raise ValidationError("A folder with this name already exists for this user.")
+
+    folder.name = name
+    try:
+        folder.save(update_fields=["name"])
+    except IntegrityError:
+        raise ValidationError("A folder with this name already exists for this user.")
+    bump_folder_listing(folder.id)
+
+
+def move_folder(folder: Folder, parent: Optional[Folder]) -> None:
+    """
+    Re-parent a folder and its whole subtree. Links from the subtree to its
+    old ancestors are replaced by the cross product of the new parent's
+    ancestors and the subtree.
+    """
+    if parent is not None and parent.owner_id != folder.owner_id:
+        raise ValidationError("Parent folder not found.")
+    if Folder.objects.filter(owner_id=folder.owner_id, parent=parent, name=folder.name).exclude(id=folder.id).exists():
+        raise ValidationError("A folder with this name already exists for this user.")
+
+    try:
+        with transaction.atomic():
+            # must come first, so the reads below see moves committed while waiting
+            lock_folder_tree(folder.owner_id)
+
+            subtree = list(FolderClosure.objects.filter(ancestor=folder).values_list("descendant_id", "depth"))
+            subtree_ids = [descendant_id for descendant_id, _ in subtree]
+            if parent is not None and parent.id in subtree_ids:
+                raise ValidationError("Cannot move a folder into its own subtree.")
+
+            FolderClosure.objects.filter(descendant_id__in=subtree_ids).exclude(ancestor_id__in=subtree_ids).delete()
+            if parent is not None:
+                ancestors = list(FolderClosure.objects.filter(descendant=parent).values_list("ancestor_id", "depth"))
+                FolderClosure.objects.bulk_create(
+                    [
+                        FolderClosure(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=up + down + 1)
+                        for ancestor_id, up in ancestors
+                        for descendant_id, down in subtree
+                    ],
+                    batch_size=1000,
+                )
+
+            folder.parent = parent
+            folder.save(update_fields=["parent"])
+
+            # Owners have implicit access everywhere; their grant row only marks
+            # the roots shown in the owner's /folders listing.
+            if parent is None:
+                FolderPermission.objects.get_or_create(
+                    folder=folder,
+                    user_id=folder.owner_id,
+                    defaults={"can_read": True, "can_upload": True, "can_delete": True},
+                )
+            else:
+                FolderPermission.objects.filter(folder=folder, user_id=folder.owner_id).delete()
+
+            # inherited permissions may change for anyone sharing this owner's folders
+            bump_folders_version(id=folder.owner_id)
+            bump_folders_version(
+                id__in=FolderPermission.objects.filter(folder__owner_id=folder.owner_id).values("user_id")
+            )
+    except IntegrityError:
+        # lost a race against a concurrent create, rename or move to the same name
+        raise ValidationError("A folder with this name already exists for this user.")
+
+    invalidate_subtree_permissions(subtree_ids)
+
+
+def get_available_folders(user_id: str) -> QuerySet:
+    """
+    Lazy projection of the folders the user can read, ordered by name.
+    Rows are turned into API dicts with serialize_folder.
+    """
+    return (
+        FolderPermission.objects.filter(user_id=user_id, can_read=True)
+        .order_by("folder__name", "folder_id")
+        .values(
+            "folder_id",
+            "folder__name",
+            "folder__parent_id",
+            "folder__owner__username",
+            "folder__file_count",
+            "folder__total_bytes",
+            "can_read",
+            "can_upload",
+            "can_delete",
+        )
+    )
+
+
+def serialize_folder(row: dict) -> dict:
+    return {
+        "id": str(row["folder_id"]),
+        "ownerUsername": row["folder__owner__username"],
+        "name": row["folder__name"],
+        "parentId": str(row["folder__parent_id"]) if row["folder__parent_id"] else None,
+        "fileCount": row["folder__file_count"],
+        "totalBytes": row["folder__total_bytes"],
+        "permissions": {
+            "read": row["can_read"],
+            "upload": row["can_upload"],
+            "delete": row["can_delete"],
+        },
+    }
@@ -0,0 +1,44 @@
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+from django.conf import settings
+
+
+class HashingPoolBusy(Exception):
+    """Raised when the password hashing queue is full."""
+
+
+class HashingPool:
+    """
+    Bounded pool for password hashing. PBKDF2 in hashlib releases the GIL,
+    so threads hash in parallel without blocking request workers or the
+    event loop. At most `workers + queue_size` jobs are accepted at once;
+    further submissions fail fast with HashingPoolBusy.
+    """
+
+    def __init__(self, workers: int, queue_size: int):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hashing")
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+
+    def submit(self, fn: Callable, *args) -> Future:
+        if not self._slots.acquire(blocking=False):
+            raise HashingPoolBusy()
+
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    async def arun(self, fn: Callable, *args):
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+
+hashing_pool = HashingPool(
+    workers=getattr(settings, "PASSWORD_HASHING_WORKERS", 4),
+    queue_size=getattr(settings, "PASSWORD_HASHING_QUEUE_SIZE", 32),
+)
@@ -1,7 +1,9 @@
 from typing import Optional
 from uuid import UUID
-from core.models import User, Folder, File, FolderPermission
-from django.db.models import F
+from core.models import User, Folder, FolderClosure, File, FolderPermission
+from django.db import connection, transaction
+from django.db.models import F, QuerySet
+from core.services.cache import token_version_cache, folder_permission_cache
 
 
 def get_user(username: str) -> Optional[User]:
@@ -16,6 +18,7 @@ def get_user_by_uuid(id: str) -> Optional[User]:
 
 def increment_token_version(id: str) -> None:
     User.objects.filter(id=id).update(token_version=F('token_version') + 1)
+    token_version_cache.delete(str(id))
 
 
 def get_folder_by_uuid(id: str) -> Optional[Folder]:
@@ -23,33 +26,178 @@ def get_folder_by_uuid(id: str) -> Optional[Folder]:
     return folder if folder else None
 
 
-def get_user_folder_permissions(folder: Folder, user: User) -> list[str]:
-    permission = FolderPermission.objects.filter(folder=folder, user=user).first()
-    perms = []
-    if not permission: return perms
-    if permission.can_read: perms.append("read")
-    if permission.can_upload: perms.append("upload")
-    if permission.can_delete: perms.append("delete")
+PERM_READ = 1
+PERM_UPLOAD = 2
+PERM_DELETE = 4
+PERM_OWNER = 8
+
+
+def get_user_folder_permissions(folder: Folder, user: User) -> int:
+    """
+    Bitmask of the user's PERM_* flags on the folder, cached per
+    (folder, user) in folder_permission_cache. Owners have every flag;
+    other users get the grant on the folder or its nearest ancestor.
+    """
+    if folder.owner_id == user.id:
+        return PERM_OWNER | PERM_READ | PERM_UPLOAD | PERM_DELETE
+
+    key = (str(folder.id), str(user.id))
+    perms = folder_permission_cache.get(key)
+    if perms is not None:
+        return perms
+
+    perms = 0
+    permission = (
+        FolderPermission.objects.filter(user=user, folder__descendant_links__descendant=folder)
+        .order_by("folder__descendant_links__depth")
+        .values_list("can_read", "can_upload", "can_delete")
+        .first()
+    )
+    if permission:
+        can_read, can_upload, can_delete = permission
+        if can_read: perms |= PERM_READ
+        if can_upload: perms |= PERM_UPLOAD
+        if can_delete: perms |= PERM_DELETE
+
+    folder_permission_cache.set(key, perms)
     return perms
 
 
+def readable_folder_ids(user: User) -> list:
+    """
+    Ids of the folders the user owns or reads through the nearest ancestor
+    grant. File queries filter on these, so the (folder, name, id) index
+    limits them to the user's folders rather than checking every file.
+    """
+    folder_ids = set(Folder.objects.filter(owner_id=user.id).values_list("id", flat=True))
+
+    # every folder below one of the user's grants, with the grant's distance
+    nearest = {}
+    below_grants = (
+        FolderPermission.objects.filter(user=user)
+        .exclude(folder__owner_id=user.id)
+        .values_list("folder__descendant_links__descendant_id", "folder__descendant_links__depth", "can_read")
+    )
+    for folder_id, depth, can_read in below_grants:
+        if folder_id not in nearest or depth < nearest[folder_id][0]:
+            nearest[folder_id] = (depth, can_read)
+
+    folder_ids.update(folder_id for folder_id, (_, can_read) in nearest.items() if can_read)
+    return list(folder_ids)
+
+
+def subtree_permissions(folder: Folder, user: User) -> dict:
+    """
+    PERM_* bitmask of the user on the folder and each of its descendants,
+    by folder id. A grant inside the subtree overrides the one above it for
+    the folders below, as in get_user_folder_permissions.
+    """
+    subtree_ids = FolderClosure.objects.filter(ancestor=folder).values("descendant_id")
+    if folder.owner_id == user.id:
+        return {folder_id: PERM_OWNER | PERM_READ | PERM_UPLOAD | PERM_DELETE
+                for folder_id in subtree_ids.values_list("descendant_id", flat=True)}
+
+    nearest = {}
+    grants = FolderPermission.objects.filter(
+        user=user, folder__descendant_links__descendant_id__in=subtree_ids
+    ).values_list(
+        "folder__descendant_links__descendant_id", "folder__descendant_links__depth",
+        "can_read", "can_upload", "can_delete",
+    )
+    for folder_id, depth, can_read, can_upload, can_delete in grants:
+        if folder_id not in nearest or depth < nearest[folder_id][0]:
+            perms = (PERM_READ if can_read else 0) | (PERM_UPLOAD if can_upload else 0) | (PERM_DELETE if can_delete else 0)
+            nearest[folder_id] = (depth, perms)
+
+    return {folder_id: nearest[folder_id][1] if folder_id in nearest else 0
+            for folder_id in subtree_ids.values_list("descendant_id", flat=True)}
+
+
+def readable_files(user: User) -> QuerySet:
+    """Files in folders the user owns or can read, see readable_folder_ids."""
+    return File.objects.filter(folder_id__in=readable_folder_ids(user))
+
+
+def invalidate_user_permissions(user_ids) -> None:
+    # a grant is inherited by every descendant, so drop all of the users' entries
+    user_ids = {str(user_id) for user_id in user_ids}
+    folder_permission_cache.delete_matching(lambda key: key[1] in user_ids)
+
+
+def invalidate_subtree_permissions(folder_ids) -> None:
+    folder_ids = {str(folder_id) for folder_id in folder_ids}
+    folder_permission_cache.delete_matching(lambda key: key[0] in folder_ids)
+
+
+def bump_folders_version(**filters) -> None:
+    """Invalidate the /folders ETag of every user matching `filters`."""
+    User.objects.filter(**filters).update(folders_version=F("folders_version") + 1)
+
+
+def bump_folder_listing(folder_id) -> None:
+    """
+    Invalidate the file listing ETag of a folder and the /folders ETag of
+    users with a direct grant on it, whose listing shows its counters.
+    """
+    Folder.objects.filter(id=folder_id).update(version=F("version") + 1)
+    bump_folders_version(id__in=FolderPermission.objects.filter(folder_id=folder_id).values("user_id"))
+
+
 def get_file_by_uuid(id: str) -> Optional[File]:
-    file = File.objects.filter(id=id).first()
+    file = File.objects.select_related("folder").filter(id=id).first()
     return file if file else None
 
 
-def get_files_in_folder(folder: Folder) -> list:
-    files = (File.objects.filter(folder=folder).order_by("name"))
-    files_list = [{ "id": str(file.id), "name": str(file.name), "size": str(round(int(file.size) / (1024 * 1024), 2)) } for file in files]
-    return files_list
+def get_files_in_folder(folder: Folder) -> QuerySet:
+    return File.objects.filter(folder=folder).order_by("name", "id").values("id", "name", "size")
+
+
+def serialize_file(row: dict) -> dict:
+    return { "id": str(row["id"]), "name": str(row["name"]), "size": str(round(int(row["size"]) / (1024 * 1024), 2)) }
 
 def modify_permissions(folder: Folder, user: User, perms_new: dict):
-    perms = FolderPermission.objects.filter(folder=folder, user=user).first()
-    if not perms:
-        perms = FolderPermission.objects.create(folder=folder, user=user)
-    
-    perms.can_read = bool(perms_new["read"])
-    perms.can_upload = bool(perms_new["upload"])
-    perms.can_delete = bool(perms_new["delete"])
-
-    perms.save()
+    # (folder, user) is unique, so concurrent grants update one row
+    FolderPermission.objects.update_or_create(
+        folder=folder,
+        user=user,
+        defaults={
+            "can_read": bool(perms_new["read"]),
+            "can_upload": bool(perms_new["upload"]),
+            "can_delete": bool(perms_new["delete"]),
+        },
+    )
+    invalidate_user_permissions([user.id])
+    bump_folders_version(id=user.id)
+
+
+def bulk_modify_permissions(folders: list[Folder], grants: dict) -> None:
+    """
+    Upsert permissions for many users on many folders in one statement.
+    `grants` maps user ids to {"read", "upload", "delete"} dicts.
+    """
+    rows = [
+        FolderPermission(
+            folder=folder,
+            user_id=user_id,
+            can_read=bool(perms["read"]),
+            can_upload=bool(perms["upload"]),
+            can_delete=bool(perms["delete"]),
+        )
+        for folder in folders
+        for user_id, perms in grants.items()
+    ]
+    if not rows:
+        return
+
+    # MySQL's ON DUPLICATE KEY UPDATE takes no conflict target
+    unique_fields = ["folder", "user"] if connection.features.supports_update_conflicts_with_target else None
+    with transaction.atomic():
+        FolderPermission.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=unique_fields,
+            update_fields=["can_read", "can_upload", "can_delete"],
+        )
+
+    invalidate_user_permissions(grants)
+    bump_folders_version(id__in=list(grants))
@@ -1,49 +1,64 @@
+import calendar
+import hashlib
+import hmac
+import json
+from base64 import urlsafe_b64encode
 from datetime import datetime, timedelta, timezone
+from typing import Optional
+from uuid import UUID
 from joserfc import jwt
 from joserfc.jwk import OctKey
 from joserfc.jwt import JWTClaimsRegistry
 from joserfc.errors import JoseError
 from django.conf import settings
-from core.models import RefreshToken
-from core.services.helpers import get_user, get_user_by_uuid
+from django.db import router, transaction
+from core.models import RefreshToken, User
+from core.services.helpers import get_user_by_uuid
+from core.services.cache import token_version_cache
 
 key = OctKey.import_key(settings.JWT_SECRET)
 
+# Issued tokens always use the same HS256 header and key, so the encoded
+# header segment and raw key bytes are computed once instead of going
+# through joserfc's registry on every encode. Decoding still uses joserfc.
+_signing_key = key.get_op_key("sign")
+_header_segment = urlsafe_b64encode(b'{"typ":"JWT","alg":"HS256"}').rstrip(b"=")
 
-def create_access_token(username: str) -> str:
-    user = get_user(username)
-    if user is None:
-        raise ValueError("user not found")
 
-    now = datetime.now(tz=timezone.utc)
+def _sign_claims(claims: dict) -> str:
+    # The claim sets built in this module never carry sensitive data, so
+    # jwt.check_sensitive_data is not needed here.
+    for name in ("iat", "exp"):
+        claims[name] = calendar.timegm(claims[name].utctimetuple())
+    payload = json.dumps(claims, separators=(",", ":")).encode()
+
+    signing_input = _header_segment + b"." + urlsafe_b64encode(payload).rstrip(b"=")
+    signature = hmac.new(_signing_key, signing_input, hashlib.sha256).digest()
+    return (signing_input + b"." + urlsafe_b64encode(signature).rstrip(b"=")).decode()
 
-    claims = {
+
+def _encode_access_token(user_id, token_version: int, now: datetime) -> str:
+    return _sign_claims({
         "iss": settings.JWT_ISSUER,
-        "sub": str(user.id),
+        "sub": str(user_id),
         "iat": now,
         "exp": now + timedelta(minutes=settings.JWT_EXP_MINUTES),
-        "tkv": str(user.token_version)
-    }
-
-    jwt.check_sensitive_data(claims)
-
-    token = jwt.encode(
-        header={"alg": "HS256"},
-        claims=claims,
-        key=key,
-    )
-
-    return token
-
-def validate_jwt(token: str) -> bool:
+        "tkv": str(token_version)
+    })
+
+def authenticate_access_token(token: str) -> Optional[User]:
+    """
+    Decode and validate an access token once, returning its user.
+    Returns None if the token is malformed, expired or revoked.
+    """
     try:
         token_decoded = jwt.decode(token, key)
     except JoseError:
-        return False
+        return None
 
-    user = get_user_by_uuid(token_decoded.claims["sub"])
+    user = _get_principal(token_decoded.claims["sub"])
     if user is None:
-        return False
+        return None
 
     claims_requests = JWTClaimsRegistry(
         iss={"essential": True, "value": settings.JWT_ISSUER},
@@ -53,47 +68,53 @@ def validate_jwt(token: str) -> bool:
     try:
         claims_requests.validate(token_decoded.claims)
     except JoseError:
-        return False
-    return True
-
-def decode_user_uuid(token: str) -> str:
-    token_decoded = jwt.decode(token, key)
-    return token_decoded.claims["sub"]
-
-
-def create_refresh_token(username: str) -> str:
-    user = get_user(username)
-    if user is None:
-        raise ValueError("user not found")
-
-    now = datetime.now(tz=timezone.utc)
-    exp = now + timedelta(minutes=settings.JWT_REFRESH_EXP_MINUTES)
-
-    token = RefreshToken.objects.create(
-        user=user,
-        issued_at=now,
-        expires_at=exp,
-        revoked_at=None,
-    )
-
-    claims = {
+        return None
+    return user
+
+def _get_principal(user_id: str) -> Optional[User]:
+    """
+    Resolve the token subject through token_version_cache, loading it from
+    the database only on a miss. Cached principals are deferred instances
+    holding just id, username and token_version.
+    """
+    cached = token_version_cache.get(user_id)
+    if cached is not None:
+        token_version, username = cached
+        return User.from_db(
+            router.db_for_read(User),
+            ["id", "username", "token_version"],
+            [UUID(user_id), username, token_version],
+        )
+
+    user = get_user_by_uuid(user_id)
+    if user is not None:
+        token_version_cache.set(user_id, (user.token_version, user.username))
+    return user
+
+
+def _encode_refresh_token(user_id, jti, now: datetime, exp: datetime) -> str:
+    return _sign_claims({
         "iss": settings.JWT_ISSUER,
-        "sub": str(user.id),
-        "jti": str(token.jti),
+        "sub": str(user_id),
+        "jti": str(jti),
         "iat": now,
         "exp": exp,
-    }
+    })
 
-    jwt.check_sensitive_data(claims)
+def issue_token_pair(user: User) -> tuple[str, str]:
+    """
+    Mint an access and refresh token for an already loaded user.
+    Only the new RefreshToken row is written; the user is not re-read.
+    """
+    now = datetime.now(tz=timezone.utc)
+    exp = now + timedelta(minutes=settings.JWT_REFRESH_EXP_MINUTES)
+    refresh_db = RefreshToken.objects.create(user_id=user.id, issued_at=now, expires_at=exp)
 
-    token = jwt.encode(
-        header={"alg": "HS256"},
-        claims=claims,
-        key=key,
+    return (
+        _encode_access_token(user.id, user.token_version, now),
+        _encode_refresh_token(user.id, refresh_db.jti, now, exp),
     )
 
-    return token
-
 def decode_token_jti(token: str) -> str:
     token_decoded = jwt.decode(token, key)
     jti = token_decoded.claims["jti"]
@@ -124,8 +145,45 @@ def validate_refresh_jwt(token: str) -> bool:
         return False
     return True
 
-def get_user_from_refresh_token(token: str):
-    jti = decode_token_jti(token)
-    token_db = RefreshToken.objects.filter(jti=jti).first()
-    return token_db.user if token_db else None
+def rotate_refresh_token(token: str) -> Optional[tuple[str, str]]:
+    """
+    Revoke a refresh token and issue a new access/refresh token pair.
 
+    The revocation is a single conditional UPDATE on the unrevoked,
+    unexpired row, so a replayed or concurrently used token matches no
+    rows and is rejected. Returns None if the token cannot be rotated.
+    """
+    try:
+        token_decoded = jwt.decode(token, key)
+        JWTClaimsRegistry(
+            iss={"essential": True, "value": settings.JWT_ISSUER},
+            sub={"essential": True},
+            jti={"essential": True},
+        ).validate(token_decoded.claims)
+    except JoseError:
+        return None
+
+    user_id = token_decoded.claims["sub"]
+    now = datetime.now(tz=timezone.utc)
+
+    with transaction.atomic():
+        revoked = RefreshToken.objects.filter(
+            jti=token_decoded.claims["jti"],
+            user_id=user_id,
+            revoked_at__isnull=True,
+            expires_at__gt=now,
+        ).update(revoked_at=now)
+        if revoked != 1:
+            return None
+
+        token_version = User.objects.filter(id=user_id).values_list("token_version", flat=True).first()
+        if token_version is None:
+            return None
+
+        exp = now + timedelta(minutes=settings.JWT_REFRESH_EXP_MINUTES)
+        refresh_db = RefreshToken.objects.create(user_id=user_id, issued_at=now, expires_at=exp)
+
+    return (
+        _encode_access_token(user_id, token_version, now),
+        _encode_refresh_token(user_id, refresh_db.jti, now, exp),
+    )
@@ -0,0 +1,54 @@
+import base64
+import binascii
+import json
+import uuid
+from typing import Optional
+from django.db.models import Q, QuerySet
+
+
+def encode_cursor(name: str, id) -> str:
+    payload = json.dumps([name, str(id)], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[str, str]:
+    try:
+        name, id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(name, str) or not isinstance(id, str):
+        raise ValueError("Invalid cursor")
+    # a non-UUID id would otherwise fail later, as a ValidationError from the id filter
+    try:
+        id = str(uuid.UUID(id))
+    except ValueError:
+        raise ValueError("Invalid cursor")
+    return name, id
+
+
+def keyset_queryset(queryset: QuerySet, cursor: str, name_field: str, id_field: str) -> QuerySet:
+    """`queryset` ordered by (name, id) and starting after `cursor`, if any."""
+    queryset = queryset.order_by(name_field, id_field)
+    if cursor:
+        name, id = decode_cursor(cursor)
+        queryset = queryset.filter(Q(**{f"{name_field}__gt": name}) | Q(**{name_field: name, f"{id_field}__gt": id}))
+    return queryset
+
+
+def keyset_page(
+    queryset: QuerySet, cursor: str, page_size: int, name_field: str, id_field: str
+) -> tuple[list, Optional[str]]:
+    """
+    Return one page of a `.values()` queryset ordered by (name, id) and the
+    cursor of the next page, or None on the last page. An empty cursor
+    starts from the beginning. Only `page_size + 1` rows are fetched.
+    """
+    if page_size < 1:
+        raise ValueError("Invalid page size")
+
+    rows = list(keyset_queryset(queryset, cursor, name_field, id_field)[: page_size + 1])
+    if len(rows) <= page_size:
+        return rows, None
+
+    rows = rows[:page_size]
+    return rows, encode_cursor(rows[-1][name_field], rows[-1][id_field])
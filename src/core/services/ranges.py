@@ -0,0 +1,68 @@
+import re
+from datetime import datetime
+from typing import Optional
+from django.utils.http import parse_http_date_safe
+
+# More ranges than this are served as the whole file (RFC 9110 14.2 allows
+# ignoring Range), which keeps a client from turning one request into
+# thousands of small storage reads.
+MAX_RANGES = 16
+
+_range_spec = re.compile(r"^(\d*)-(\d*)$")
+
+
+class RangeNotSatisfiable(Exception):
+    """None of the requested ranges overlap the file."""
+
+
+def parse_range_header(header: str, size: int) -> Optional[list[tuple[int, int]]]:
+    """
+    Inclusive (start, end) byte ranges of a "bytes=..." Range header for a
+    file of `size` bytes, sorted with overlapping and adjacent ranges merged.
+    Returns None when the header should be ignored (malformed, another unit
+    or too many ranges) and raises RangeNotSatisfiable when every range
+    lies past the end of the file.
+    """
+    unit, _, specs = header.partition("=")
+    if unit.strip().lower() != "bytes" or not specs or specs.count(",") >= MAX_RANGES:
+        return None
+
+    ranges = []
+    for spec in specs.split(","):
+        match = _range_spec.match(spec.strip())
+        if not match or match.group(1) == match.group(2) == "":
+            return None
+        first, last = match.groups()
+        if first == "":
+            # suffix range: the last N bytes
+            if int(last) == 0:
+                continue
+            start, end = max(size - int(last), 0), size - 1
+        else:
+            start, end = int(first), size - 1 if last == "" else min(int(last), size - 1)
+            if int(first) > (int(last) if last else start):
+                return None
+        if start < size:
+            ranges.append((start, end))
+
+    if not ranges:
+        raise RangeNotSatisfiable()
+
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        if start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def if_range_matches(header: Optional[str], etag: str, last_modified: datetime) -> bool:
+    """Whether an If-Range header (absent counts as a match) still holds."""
+    if header is None:
+        return True
+    if header.startswith('"'):
+        return header == etag
+    date = parse_http_date_safe(header)
+    return date is not None and date == int(last_modified.timestamp())
@@ -0,0 +1,51 @@
+from django.db import connection
+from django.db.models import Lookup, QuerySet
+from core.models import File, User
+from core.services.helpers import readable_files
+
+# Shortest substring the ngram FULLTEXT index can match (ngram_token_size).
+MIN_QUERY_LENGTH = 2
+
+
+class NgramMatch(Lookup):
+    """MATCH ... AGAINST phrase search backed by the ft_file_name ngram index."""
+
+    lookup_name = "ngram_match"
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        # a quoted phrase matches consecutive ngrams, i.e. a substring
+        rhs_params = ['"' + str(param).replace('"', " ") + '"' for param in rhs_params]
+        return f"MATCH ({lhs}) AGAINST ({rhs} IN BOOLEAN MODE)", [*lhs_params, *rhs_params]
+
+
+File._meta.get_field("name").register_lookup(NgramMatch)
+
+
+def search_files(user: User, query: str, prefix: bool = False) -> QuerySet:
+    """
+    Files whose name starts with (prefix=True) or contains `query`, limited
+    to folders the user can read. Returns a `.values()` queryset for
+    keyset_page on (name, id).
+    """
+    files = readable_files(user)
+    if prefix:
+        # a plain LIKE on MySQL; startswith is LIKE BINARY, which is case-sensitive and skips the index
+        files = files.filter(name__istartswith=query)
+    elif connection.vendor == "mysql":
+        files = files.filter(name__ngram_match=query, name__icontains=query)
+    else:
+        files = files.filter(name__icontains=query)
+
+    return files.values("id", "name", "size", "folder_id", "folder__name")
+
+
+def serialize_search_result(row: dict) -> dict:
+    return {
+        "id": str(row["id"]),
+        "name": row["name"],
+        "size": str(round(int(row["size"]) / (1024 * 1024), 2)),
+        "folderId": str(row["folder_id"]),
+        "folderName": row["folder__name"],
+    }
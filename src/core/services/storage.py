@@ -0,0 +1,496 @@
+import base64
+import functools
+import json
+import os
+import shutil
+import tempfile
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from hashlib import md5
+from pathlib import Path
+from typing import AsyncIterator, BinaryIO, Iterator, Optional
+from asgiref.sync import sync_to_async
+from azure.core.exceptions import ResourceNotFoundError
+from azure.storage.blob import BlobBlock, BlobSasPermissions, ContentSettings
+from django.conf import settings
+from django.http import FileResponse, StreamingHttpResponse
+from django.http.response import HttpResponseBase
+from django.utils.module_loading import import_string
+from core.services.azure import generate_blob_url, get_async_blob_client, get_blob_client, get_container_client
+
+CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def block_id(index: int) -> str:
+    """Block ids must all have the same length within a blob."""
+    return f"{index:08d}"
+
+
+class BlobNotFound(Exception):
+    """Raised when a named blob does not exist in storage."""
+
+
+@dataclass
+class BlobVersion:
+    """What storage reports for a blob once it is written."""
+
+    etag: str
+    last_modified: datetime
+    content_md5: Optional[str]  # base64, as in a Content-MD5 header
+
+
+@dataclass
+class BlobProperties(BlobVersion):
+    size: int
+    content_type: str
+
+
+def encode_md5(digest: Optional[bytes]) -> Optional[str]:
+    return base64.b64encode(digest).decode() if digest else None
+
+
+class StorageBackend:
+    """
+    Blob storage used for file contents. Blobs are addressed by name
+    ("<file id>_<file name>"); every method raises BlobNotFound for
+    missing blobs, except exists().
+    """
+
+    # Whether upload_url() and download_url() can hand clients signed URLs
+    supports_signed_urls = False
+
+    def save(self, name: str, content: BinaryIO, content_type: str) -> BlobVersion:
+        raise NotImplementedError
+
+    def open(self, name: str, offset: int = 0, length: Optional[int] = None) -> Iterator[bytes]:
+        """Stream the blob, or `length` bytes of it starting at `offset`."""
+        raise NotImplementedError
+
+    def stage_block(self, name: str, block_id: str, data: bytes) -> None:
+        """Store an uncommitted block; the blob is unchanged until commit_blocks()."""
+        raise NotImplementedError
+
+    def commit_blocks(
+        self, name: str, block_ids: list[str], content_type: str, content_md5: Optional[str] = None
+    ) -> BlobVersion:
+        """
+        Replace the blob with the staged blocks, in order. `content_md5` is
+        stored with the blob when the caller hashed the content. Backends
+        that do not hash blocks themselves (Azure) return no MD5 otherwise.
+        """
+        raise NotImplementedError
+
+    def discard_blocks(self, name: str) -> None:
+        """Drop uncommitted blocks of an abandoned upload."""
+        raise NotImplementedError
+
+    def staged_blocks(self, name: str) -> dict[str, int]:
+        """Sizes of the uncommitted blocks of `name`, by block id."""
+        raise NotImplementedError
+
+    def delete(self, name: str) -> None:
+        raise NotImplementedError
+
+    def delete_many(self, names: list[str]) -> list[str]:
+        """
+        Delete blobs, treating missing ones as deleted. Returns the names
+        that could not be deleted, for the caller to retry.
+        """
+        failed = []
+        for name in names:
+            try:
+                self.delete(name)
+            except BlobNotFound:
+                pass
+            except Exception:
+                failed.append(name)
+        return failed
+
+    def exists(self, name: str) -> bool:
+        try:
+            self.properties(name)
+        except BlobNotFound:
+            return False
+        return True
+
+    def properties(self, name: str) -> BlobProperties:
+        raise NotImplementedError
+
+    def upload_url(self, name: str, content_type: str, expiry: datetime) -> tuple[str, dict]:
+        """
+        Short-lived URL the client can PUT the blob to directly, and the
+        headers it must send. Only available on remote backends.
+        """
+        raise NotImplementedError
+
+    def download_url(self, name: str, filename: str, content_type: str, expiry: datetime) -> str:
+        """
+        Short-lived URL the client can GET the blob from directly, served
+        as an attachment named `filename`. Only available on remote backends.
+        """
+        raise NotImplementedError
+
+    # Async counterparts for async views. The defaults run the sync methods
+    # in worker threads; backends with an async client override them.
+
+    async def aopen(self, name: str, offset: int = 0, length: Optional[int] = None) -> AsyncIterator[bytes]:
+        chunks = await sync_to_async(self.open, thread_sensitive=False)(name, offset, length)
+        return _iterate_in_thread(chunks)
+
+    async def adelete(self, name: str) -> None:
+        await sync_to_async(self.delete, thread_sensitive=False)(name)
+
+    async def acommit_blocks(
+        self, name: str, block_ids: list[str], content_type: str, content_md5: Optional[str] = None
+    ) -> BlobVersion:
+        return await sync_to_async(self.commit_blocks, thread_sensitive=False)(
+            name, block_ids, content_type, content_md5
+        )
+
+    def download_response(self, name: str, filename: str, content_type: str) -> HttpResponseBase:
+        response = StreamingHttpResponse(self.open(name), content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+
+async def _iterate_in_thread(chunks: Iterator[bytes]) -> AsyncIterator[bytes]:
+    next_chunk = sync_to_async(next, thread_sensitive=False)
+    while (chunk := await next_chunk(chunks, None)) is not None:
+        yield chunk
+
+
+class AzureBlobStorage(StorageBackend):
+    """Azure Blob Storage; the client is only created on first use."""
+
+    supports_signed_urls = True
+
+    def _blob(self, name: str):
+        return get_blob_client(name)
+
+    def save(self, name: str, content: BinaryIO, content_type: str) -> BlobVersion:
+        result = self._blob(name).upload_blob(
+            content, overwrite=True, content_settings=ContentSettings(content_type=content_type)
+        )
+        return BlobVersion(
+            etag=result["etag"],
+            last_modified=result["last_modified"],
+            content_md5=encode_md5(result.get("content_md5")),
+        )
+
+    def open(self, name: str, offset: int = 0, length: Optional[int] = None) -> Iterator[bytes]:
+        try:
+            stream = self._blob(name).download_blob(offset=offset, length=length)
+        except ResourceNotFoundError:
+            raise BlobNotFound(name)
+        return stream.chunks()
+
+    def stage_block(self, name: str, block_id: str, data: bytes) -> None:
+        self._blob(name).stage_block(block_id, data, length=len(data))
+
+    def commit_blocks(
+        self, name: str, block_ids: list[str], content_type: str, content_md5: Optional[str] = None
+    ) -> BlobVersion:
+        result = self._blob(name).commit_block_list(
+            [BlobBlock(block_id=block_id) for block_id in block_ids],
+            content_settings=self._content_settings(content_type, content_md5),
+        )
+        return BlobVersion(etag=result["etag"], last_modified=result["last_modified"], content_md5=content_md5)
+
+    @staticmethod
+    def _content_settings(content_type: str, content_md5: Optional[str]) -> ContentSettings:
+        md5_bytes = bytearray(base64.b64decode(content_md5)) if content_md5 else None
+        return ContentSettings(content_type=content_type, content_md5=md5_bytes)
+
+    async def aopen(self, name: str, offset: int = 0, length: Optional[int] = None) -> AsyncIterator[bytes]:
+        try:
+            stream = await get_async_blob_client(name).download_blob(offset=offset, length=length)
+        except ResourceNotFoundError:
+            raise BlobNotFound(name)
+        return stream.chunks()
+
+    async def adelete(self, name: str) -> None:
+        try:
+            await get_async_blob_client(name).delete_blob()
+        except ResourceNotFoundError:
+            raise BlobNotFound(name)
+
+    async def acommit_blocks(
+        self, name: str, block_ids: list[str], content_type: str, content_md5: Optional[str] = None
+    ) -> BlobVersion:
+        result = await get_async_blob_client(name).commit_block_list(
+            [BlobBlock(block_id=block_id) for block_id in block_ids],
+            content_settings=self._content_settings(content_type, content_md5),
+        )
+        return BlobVersion(etag=result["etag"], last_modified=result["last_modified"], content_md5=content_md5)
+
+    def discard_blocks(self, name: str) -> None:
+        # Uncommitted blocks cannot be deleted directly (Azure keeps them for
+        # a week); committing an empty block list drops them, then the empty
+        # blob goes too.
+        blob = self._blob(name)
+        blob.commit_block_list([])
+        try:
+            blob.delete_blob()
+        except ResourceNotFoundError:
+            pass
+
+    def staged_blocks(self, name: str) -> dict[str, int]:
+        try:
+            _, uncommitted = self._blob(name).get_block_list("uncommitted")
+        except ResourceNotFoundError:
+            return {}
+        return {block.id: block.size for block in uncommitted}
+
+    def delete(self, name: str) -> None:
+        try:
+            self._blob(name).delete_blob()
+        except ResourceNotFoundError:
+            raise BlobNotFound(name)
+
+    # Blob batch requests carry at most this many sub-requests
+    BATCH_LIMIT = 256
+
+    def delete_many(self, names: list[str]) -> list[str]:
+        failed = []
+        for start in range(0, len(names), self.BATCH_LIMIT):
+            batch = names[start : start + self.BATCH_LIMIT]
+            try:
+                responses = list(get_container_client().delete_blobs(*batch, raise_on_any_failure=False))
+            except Exception:
+                failed.extend(batch)
+                continue
+            failed.extend(name for name, response in zip(batch, responses) if response.status_code not in (202, 404))
+        return failed
+
+    def exists(self, name: str) -> bool:
+        return self._blob(name).exists()
+
+    def properties(self, name: str) -> BlobProperties:
+        try:
+            properties = self._blob(name).get_blob_properties()
+        except ResourceNotFoundError:
+            raise BlobNotFound(name)
+        return BlobProperties(
+            size=properties.size,
+            content_type=properties.content_settings.content_type,
+            etag=properties.etag,
+            last_modified=properties.last_modified,
+            content_md5=encode_md5(properties.content_settings.content_md5),
+        )
+
+    def upload_url(self, name: str, content_type: str, expiry: datetime) -> tuple[str, dict]:
+        # create only: once the blob exists the URL cannot overwrite what /complete checked
+        url = generate_blob_url(name, BlobSasPermissions(create=True), expiry)
+        return url, {"x-ms-blob-type": "BlockBlob", "x-ms-blob-content-type": content_type}
+
+    def download_url(self, name: str, filename: str, content_type: str, expiry: datetime) -> str:
+        return generate_blob_url(
+            name,
+            BlobSasPermissions(read=True),
+            expiry,
+            content_disposition=f'attachment; filename="{filename}"',
+            content_type=content_type,
+        )
+
+
+class LocalFileStorage(StorageBackend):
+    """
+    Blobs stored as files under LOCAL_STORAGE_ROOT, with content types in
+    sidecar JSON files. Downloads are FileResponses, which WSGI servers
+    hand to sendfile() without copying through Python.
+    """
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = Path(root or settings.LOCAL_STORAGE_ROOT).resolve()
+        (self.root / "blobs").mkdir(parents=True, exist_ok=True)
+        (self.root / "meta").mkdir(parents=True, exist_ok=True)
+        (self.root / "staging").mkdir(parents=True, exist_ok=True)
+
+    def _paths(self, name: str) -> tuple[Path, Path]:
+        blob = (self.root / "blobs" / name).resolve()
+        if blob.parent != self.root / "blobs":
+            raise BlobNotFound(name)  # names must not escape the storage root
+        return blob, self.root / "meta" / f"{blob.name}.json"
+
+    def save(self, name: str, content: BinaryIO, content_type: str) -> BlobVersion:
+        blob, meta = self._paths(name)
+        digest = md5()
+        with tempfile.NamedTemporaryFile(dir=blob.parent, delete=False) as tmp:
+            while chunk := content.read(CHUNK_SIZE):
+                digest.update(chunk)
+                tmp.write(chunk)
+        return self._replace(name, tmp.name, content_type, digest.digest())
+
+    def _replace(self, name: str, tmp_name: str, content_type: str, digest: bytes) -> BlobVersion:
+        blob, meta = self._paths(name)
+        meta.write_text(json.dumps({"content_type": content_type, "content_md5": encode_md5(digest)}))
+        os.replace(tmp_name, blob)
+        return self.properties(name)
+
+    def _staging(self, name: str, block_id: Optional[str] = None) -> Path:
+        staging = self.root / "staging" / self._paths(name)[0].name
+        if block_id is None:
+            return staging
+        if Path(block_id).name != block_id:
+            raise ValueError(f"Invalid block id: {block_id!r}")
+        return staging / block_id
+
+    def stage_block(self, name: str, block_id: str, data: bytes) -> None:
+        path = self._staging(name, block_id)
+        path.parent.mkdir(exist_ok=True)
+        path.write_bytes(data)
+
+    def commit_blocks(
+        self, name: str, block_ids: list[str], content_type: str, content_md5: Optional[str] = None
+    ) -> BlobVersion:
+        blob, _ = self._paths(name)
+        digest = md5()
+        with tempfile.NamedTemporaryFile(dir=blob.parent, delete=False) as tmp:
+            for block_id in block_ids:
+                try:
+                    data = self._staging(name, block_id).read_bytes()
+                except FileNotFoundError:
+                    os.unlink(tmp.name)
+                    raise BlobNotFound(f"{name}: block {block_id}")
+                digest.update(data)
+                tmp.write(data)
+        version = self._replace(name, tmp.name, content_type, digest.digest())
+        self.discard_blocks(name)
+        return version
+
+    def discard_blocks(self, name: str) -> None:
+        shutil.rmtree(self._staging(name), ignore_errors=True)
+
+    def staged_blocks(self, name: str) -> dict[str, int]:
+        try:
+            return {entry.name: entry.stat().st_size for entry in os.scandir(self._staging(name))}
+        except FileNotFoundError:
+            return {}
+
+    def open(self, name: str, offset: int = 0, length: Optional[int] = None) -> Iterator[bytes]:
+        blob, _ = self._paths(name)
+        try:
+            f = blob.open("rb")
+        except FileNotFoundError:
+            raise BlobNotFound(name)
+        return self._read(f, offset, length)
+
+    @staticmethod
+    def _read(f: BinaryIO, offset: int, length: Optional[int]) -> Iterator[bytes]:
+        with f:
+            f.seek(offset)
+            remaining = length
+            while remaining is None or remaining > 0:
+                chunk = f.read(CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    return
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def delete(self, name: str) -> None:
+        blob, meta = self._paths(name)
+        try:
+            blob.unlink()
+        except FileNotFoundError:
+            raise BlobNotFound(name)
+        meta.unlink(missing_ok=True)
+
+    def properties(self, name: str) -> BlobProperties:
+        blob, meta = self._paths(name)
+        try:
+            stat = blob.stat()
+            metadata = json.loads(meta.read_text())
+        except FileNotFoundError:
+            raise BlobNotFound(name)
+        return BlobProperties(
+            size=stat.st_size,
+            content_type=metadata["content_type"],
+            etag=f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"',
+            last_modified=datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc),
+            content_md5=metadata.get("content_md5"),
+        )
+
+    def download_response(self, name: str, filename: str, content_type: str) -> HttpResponseBase:
+        blob, _ = self._paths(name)
+        try:
+            f = blob.open("rb")
+        except FileNotFoundError:
+            raise BlobNotFound(name)
+        return FileResponse(f, as_attachment=True, filename=filename, content_type=content_type)
+
+
+class InMemoryStorage(StorageBackend):
+    """Process-local storage for tests and benchmarks."""
+
+    def __init__(self):
+        self._blobs: dict[str, tuple[bytes, BlobProperties]] = {}
+        self._staged: dict[str, dict[str, bytes]] = {}
+        self._lock = threading.Lock()
+
+    def save(self, name: str, content: BinaryIO, content_type: str) -> BlobVersion:
+        return self._store(name, content.read(), content_type)
+
+    def stage_block(self, name: str, block_id: str, data: bytes) -> None:
+        with self._lock:
+            self._staged.setdefault(name, {})[block_id] = bytes(data)
+
+    def commit_blocks(
+        self, name: str, block_ids: list[str], content_type: str, content_md5: Optional[str] = None
+    ) -> BlobVersion:
+        with self._lock:
+            staged = self._staged.get(name, {})
+            missing = [block_id for block_id in block_ids if block_id not in staged]
+            if missing:
+                raise BlobNotFound(f"{name}: block {missing[0]}")
+            data = b"".join(staged[block_id] for block_id in block_ids)
+            self._staged.pop(name, None)
+        return self._store(name, data, content_type)
+
+    def discard_blocks(self, name: str) -> None:
+        with self._lock:
+            self._staged.pop(name, None)
+
+    def staged_blocks(self, name: str) -> dict[str, int]:
+        with self._lock:
+            return {block_id: len(data) for block_id, data in self._staged.get(name, {}).items()}
+
+    def _store(self, name: str, data: bytes, content_type: str) -> BlobProperties:
+        digest = md5(data).digest()
+        properties = BlobProperties(
+            size=len(data),
+            content_type=content_type,
+            etag=f'"{digest.hex()}"',
+            last_modified=datetime.now(tz=timezone.utc),
+            content_md5=encode_md5(digest),
+        )
+        with self._lock:
+            self._blobs[name] = (data, properties)
+        return properties
+
+    def open(self, name: str, offset: int = 0, length: Optional[int] = None) -> Iterator[bytes]:
+        data = self._get(name)[0]
+        end = len(data) if length is None else offset + length
+        return iter([data[offset:end]])
+
+    def delete(self, name: str) -> None:
+        with self._lock:
+            if self._blobs.pop(name, None) is None:
+                raise BlobNotFound(name)
+
+    def properties(self, name: str) -> BlobProperties:
+        return self._get(name)[1]
+
+    def _get(self, name: str) -> tuple[bytes, BlobProperties]:
+        with self._lock:
+            try:
+                return self._blobs[name]
+            except KeyError:
+                raise BlobNotFound(name)
+
+
+@functools.cache
+def get_storage() -> StorageBackend:
+    """The backend named by STORAGE_BACKEND, created on first use."""
+    return import_string(settings.STORAGE_BACKEND)()
@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from core.models import User, Folder
+from core.services.helpers import bump_folder_listing
+
+# Folder.file_count/total_bytes count the files in a folder and
+# User.file_count/total_bytes roll those up over the folders a user owns.
+# Uploads are charged to the folder owner's quota. Every change also bumps
+# the folder's listing version (see bump_folder_listing).
+
+
+def quota_allows(folder: Folder, size: int) -> bool:
+    """Whether the folder owner has room for `size` more bytes, without charging it."""
+    quota = getattr(settings, "USER_STORAGE_QUOTA", None)
+    if quota is None:
+        return True
+    used = User.objects.filter(id=folder.owner_id).values_list("total_bytes", flat=True).first()
+    return used is not None and used + size <= quota
+
+
+def add_file_usage(folder: Folder, size: int) -> bool:
+    """
+    Charge a new file to its folder and the folder owner. Returns False,
+    without changing anything, if the owner's USER_STORAGE_QUOTA would be
+    exceeded. The quota check and the increment are one conditional UPDATE.
+    """
+    quota = getattr(settings, "USER_STORAGE_QUOTA", None)
+
+    with transaction.atomic():
+        owner = User.objects.filter(id=folder.owner_id)
+        if quota is not None:
+            owner = owner.filter(total_bytes__lte=quota - size)
+        if not owner.update(file_count=F("file_count") + 1, total_bytes=F("total_bytes") + size):
+            return False
+
+        Folder.objects.filter(id=folder.id).update(
+            file_count=F("file_count") + 1, total_bytes=F("total_bytes") + size
+        )
+        bump_folder_listing(folder.id)
+    return True
+
+
+def remove_folder_usage(owner_id, file_count: int, total_bytes: int) -> None:
+    """Release the files of deleted folders from their owner; the folder rows are gone."""
+    User.objects.filter(id=owner_id).update(
+        file_count=Greatest(F("file_count") - file_count, 0), total_bytes=Greatest(F("total_bytes") - total_bytes, 0)
+    )
+
+
+def remove_file_usage(folder: Folder, size: int) -> None:
+    # Clamp at zero so drifted counters never make the UPDATE fail;
+    # reconcile_storage_counters repairs the drift.
+    with transaction.atomic():
+        User.objects.filter(id=folder.owner_id).update(
+            file_count=Greatest(F("file_count") - 1, 0), total_bytes=Greatest(F("total_bytes") - size, 0)
+        )
+        Folder.objects.filter(id=folder.id).update(
+            file_count=Greatest(F("file_count") - 1, 0), total_bytes=Greatest(F("total_bytes") - size, 0)
+        )
+        bump_folder_listing(folder.id)
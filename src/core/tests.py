@@ -1,3 +1,519 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import warnings
+from datetime import datetime, timezone
+from unittest import mock, skipUnless
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.contrib.auth.hashers import make_password
+from django.test import AsyncRequestFactory, Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from core import blob_views
+from core.models import File, Folder, PendingUpload, User
+from core.services.cache import token_version_cache
+from core.services.folders_operations import create_folder_for_user
+from core.services.helpers import modify_permissions
+from core.services.jwt import issue_token_pair
+from core.services.pagination import encode_cursor
+from core.services.storage import AzureBlobStorage, InMemoryStorage, get_storage
 
-# Create your tests here.
+
+class JwtRequiredTests(TestCase):
+    """A protected view authenticates with one query on a cold cache and none on a warm one."""
+
+    def setUp(self):
+        token_version_cache.clear()
+        self.user = User.objects.create(username="alice", password_hash="-")
+        self.client.cookies["access_token"] = issue_token_pair(self.user)[0]
+        # GET /folders answers If-None-Match with 304 after a single version lookup
+        self.etag = self.client.get("/folders")["ETag"]
+        token_version_cache.clear()
+
+    def get_folders(self):
+        return self.client.get("/folders", HTTP_IF_NONE_MATCH=self.etag)
+
+    def test_cold_cache(self):
+        with self.assertNumQueries(2):
+            self.assertEqual(self.get_folders().status_code, 304)
+
+    def test_warm_cache(self):
+        self.get_folders()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get_folders().status_code, 304)
+
+    def test_missing_token(self):
+        del self.client.cookies["access_token"]
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get("/folders").status_code, 401)
+
+    def test_revoked_token(self):
+        User.objects.filter(id=self.user.id).update(token_version=1)
+        self.assertEqual(self.get_folders().status_code, 401)
+
+
+class CursorTests(TestCase):
+    def setUp(self):
+        token_version_cache.clear()
+        user = User.objects.create(username="alice", password_hash="-")
+        self.client.cookies["access_token"] = issue_token_pair(user)[0]
+
+    def test_forged_cursor_id(self):
+        response = self.client.get("/folders", {"cursor": encode_cursor("a", "zzz")})
+        self.assertEqual(response.status_code, 400)
+
+
+class SignedInMemoryStorage(InMemoryStorage):
+    """InMemoryStorage posing as a backend with signed URLs; the test plays the client's PUT."""
+
+    supports_signed_urls = True
+
+    def upload_url(self, name, content_type, expiry):
+        return f"memory://{name}", {"x-ms-blob-content-type": content_type}
+
+
+@override_settings(STORAGE_BACKEND="core.tests.SignedInMemoryStorage")
+class DirectUploadTests(TestCase):
+    def setUp(self):
+        get_storage.cache_clear()
+        self.addCleanup(get_storage.cache_clear)
+        token_version_cache.clear()
+
+        self.user = User.objects.create(username="alice", password_hash="-")
+        self.folder = create_folder_for_user("docs", self.user.id)
+        self.client.cookies["access_token"] = issue_token_pair(self.user)[0]
+
+    def start(self, size):
+        body = {"dir": str(self.folder.id), "name": "a.txt", "size": size, "contentType": "text/plain"}
+        response = self.client.post("/file/upload/start", json.dumps(body), content_type="application/json")
+        self.assertEqual(response.status_code, 201)
+        return response.json()["uploadId"]
+
+    def put(self, upload_id, data):
+        get_storage().save(f"{upload_id}_a.txt", io.BytesIO(data), "text/plain")
+
+    def complete(self, upload_id):
+        return self.client.post(f"/file/upload/{upload_id}/complete")
+
+    def test_upload(self):
+        upload_id = self.start(5)
+        self.put(upload_id, b"hello")
+
+        response = self.complete(upload_id)
+        self.assertEqual(response.status_code, 200)
+        file = File.objects.get(id=upload_id)
+        self.assertEqual((file.size, file.content_type), (5, "text/plain"))
+        self.assertEqual(file.etag, get_storage().properties(file.blob_name).etag)
+        self.assertFalse(PendingUpload.objects.exists())
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.file_count, self.user.total_bytes), (1, 5))
+
+    def test_size_mismatch(self):
+        upload_id = self.start(5)
+        self.put(upload_id, b"hello, world")
+
+        self.assertEqual(self.complete(upload_id).status_code, 400)
+        self.assertFalse(get_storage().exists(f"{upload_id}_a.txt"))
+        self.assertFalse(File.objects.exists())
+
+        # the URL stays valid, so the row is kept for purge_pending_uploads to own the name
+        upload = PendingUpload.objects.get(id=upload_id)
+        self.put(upload_id, b"hello, world")
+        PendingUpload.objects.filter(id=upload_id).update(expires_at=datetime.now(tz=timezone.utc))
+        call_command("purge_pending_uploads", stdout=io.StringIO())
+        self.assertFalse(get_storage().exists(upload.blob_name))
+        self.assertFalse(PendingUpload.objects.exists())
+
+    def test_replayed_complete(self):
+        upload_id = self.start(5)
+        self.put(upload_id, b"hello")
+        self.assertEqual(self.complete(upload_id).status_code, 200)
+
+        self.assertEqual(self.complete(upload_id).status_code, 404)
+        self.assertEqual(File.objects.count(), 1)
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.file_count, self.user.total_bytes), (1, 5))
+
+    def test_upload_url_cannot_overwrite(self):
+        expiry = datetime.now(tz=timezone.utc)
+        with mock.patch("core.services.storage.generate_blob_url", return_value="https://blob") as sign:
+            AzureBlobStorage().upload_url("x_a.txt", "text/plain", expiry)
+
+        permission = sign.call_args.args[1]
+        self.assertTrue(permission.create)
+        self.assertFalse(permission.write)
+
+
+@override_settings(STORAGE_BACKEND="core.services.storage.InMemoryStorage", UPLOAD_BLOCK_SIZE=4)
+class StreamingUploadTests(TestCase):
+    def setUp(self):
+        get_storage.cache_clear()
+        self.addCleanup(get_storage.cache_clear)
+        token_version_cache.clear()
+
+        owner = User.objects.create(username="alice", password_hash="-")
+        self.folder = create_folder_for_user("docs", owner.id)
+        self.client.cookies["access_token"] = issue_token_pair(owner)[0]
+
+    def upload(self, query):
+        return self.client.post(f"/file/upload?{query}", {"file": SimpleUploadedFile("a.txt", b"hello", "text/plain")})
+
+    def test_upload(self):
+        response = self.upload(f"dir={self.folder.id}&size=5")
+        self.assertEqual(response.status_code, 200)
+        file = File.objects.get()
+        self.assertEqual(b"".join(get_storage().open(file.blob_name)), b"hello")
+
+    def test_forbidden_folder_stages_nothing(self):
+        stranger = User.objects.create(username="bob", password_hash="-")
+        self.client.cookies["access_token"] = issue_token_pair(stranger)[0]
+        with mock.patch.object(InMemoryStorage, "stage_block") as stage_block:
+            self.assertEqual(self.upload(f"dir={self.folder.id}").status_code, 403)
+        stage_block.assert_not_called()
+
+    def test_dir_in_form(self):
+        file = SimpleUploadedFile("a.txt", b"hello", "text/plain")
+        response = self.client.post("/file/upload", {"dir": str(self.folder.id), "file": file})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(get_storage().open(File.objects.get().blob_name)), b"hello")
+
+    def test_dir_in_form_forbidden(self):
+        stranger = User.objects.create(username="bob", password_hash="-")
+        self.client.cookies["access_token"] = issue_token_pair(stranger)[0]
+        file = SimpleUploadedFile("a.txt", b"hello", "text/plain")
+        with mock.patch.object(InMemoryStorage, "save") as save:
+            response = self.client.post("/file/upload", {"dir": str(self.folder.id), "file": file})
+        self.assertEqual(response.status_code, 403)
+        save.assert_not_called()
+
+    def test_larger_than_declared(self):
+        self.assertEqual(self.upload(f"dir={self.folder.id}&size=4").status_code, 400)
+        self.assertFalse(get_storage()._staged)
+        self.assertFalse(File.objects.exists())
+
+
+class ResumableUploadTests(TestCase):
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        storage_settings = override_settings(
+            STORAGE_BACKEND="core.services.storage.LocalFileStorage", LOCAL_STORAGE_ROOT=root.name
+        )
+        storage_settings.enable()
+        self.addCleanup(storage_settings.disable)
+        get_storage.cache_clear()
+        self.addCleanup(get_storage.cache_clear)
+        token_version_cache.clear()
+
+        owner = User.objects.create(username="alice", password_hash="-")
+        self.folder = create_folder_for_user("docs", owner.id)
+        self.client.cookies["access_token"] = issue_token_pair(owner)[0]
+
+    def start(self, name):
+        body = {"dir": str(self.folder.id), "name": name, "size": 5, "contentType": "text/plain", "chunked": True}
+        return self.client.post("/file/upload/start", json.dumps(body), content_type="application/json")
+
+    def test_path_in_name(self):
+        for name in ("a/b.txt", "../../b.txt", "..\\b.txt"):
+            upload_id = self.start(name).json()["uploadId"]
+            self.assertEqual(PendingUpload.objects.get(id=upload_id).name, "b.txt")
+
+            url = f"/file/upload/{upload_id}/chunks/0"
+            self.assertEqual(self.client.put(url, b"hello", content_type="application/octet-stream").status_code, 204)
+            self.assertEqual(self.client.post(f"/file/upload/{upload_id}/complete").status_code, 200)
+
+    def test_unusable_name(self):
+        for name in ("..", "dir/", "x" * 256):
+            self.assertEqual(self.start(name).status_code, 400)
+
+
+class SharedFolderTests(TestCase):
+    def setUp(self):
+        token_version_cache.clear()
+        owner = User.objects.create(username="alice", password_hash="-")
+        self.folder = create_folder_for_user("docs", owner.id)
+        self.child = create_folder_for_user("reports", owner.id, parent_id=self.folder.id)
+
+        self.user = User.objects.create(username="bob", password_hash="-")
+        modify_permissions(self.folder, self.user, {"read": True, "upload": True, "delete": True})
+        self.client.cookies["access_token"] = issue_token_pair(self.user)[0]
+
+    def test_delete_granted_subtree(self):
+        self.assertEqual(self.client.delete(f"/folders/{self.folder.id}").status_code, 202)
+        self.assertFalse(Folder.objects.exists())
+
+    def test_descendant_without_delete(self):
+        modify_permissions(self.child, self.user, {"read": True, "upload": False, "delete": False})
+        self.assertEqual(self.client.delete(f"/folders/{self.folder.id}").status_code, 403)
+        self.assertEqual(Folder.objects.count(), 2)
+
+    def test_tree_hides_unreadable_descendants(self):
+        modify_permissions(self.child, self.user, {"read": False, "upload": False, "delete": False})
+        items = self.client.get(f"/folders/{self.folder.id}/tree").json()["items"]
+        self.assertEqual([item["id"] for item in items], [str(self.folder.id)])
+
+
+class FolderDetailTests(TestCase):
+    def setUp(self):
+        token_version_cache.clear()
+        owner = User.objects.create(username="alice", password_hash="-")
+        self.folder = create_folder_for_user("docs", owner.id)
+        self.other = create_folder_for_user("reports", owner.id)
+        create_folder_for_user("taken", owner.id, parent_id=self.other.id)
+        self.client.cookies["access_token"] = issue_token_pair(owner)[0]
+
+    def test_move_and_rename_roll_back_together(self):
+        body = json.dumps({"parent": str(self.other.id), "name": "taken"})
+        response = self.client.patch(f"/folders/{self.folder.id}", body, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.folder.refresh_from_db()
+        self.assertEqual((self.folder.parent_id, self.folder.name), (None, "docs"))
+
+
+@override_settings(EXPORT_CHUNK_SIZE=2)
+class ExportTests(TestCase):
+    def setUp(self):
+        token_version_cache.clear()
+        self.user = User.objects.create(username="alice", password_hash="-")
+        self.client.cookies["access_token"] = issue_token_pair(self.user)[0]
+
+    def test_export_every_readable_folder(self):
+        names = set()
+        for folder_name in ("docs", "reports"):
+            folder = create_folder_for_user(folder_name, self.user.id)
+            for i in range(3):
+                name = f"{folder_name}-{i}.txt"
+                File.objects.create(name=name, folder=folder, size=1, blob_name=name, modified_at=datetime.now(tz=timezone.utc))
+                names.add(name)
+
+        response = self.client.get("/folders/export")
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual(len(rows), 6)
+        self.assertEqual({row["name"] for row in rows}, names)
+
+
+@skipUnless(connection.vendor == "mysql", "EXPLAIN checks require the MySQL backend")
+class HotQueryTests(TestCase):
+    def test_hot_queries_use_indexes(self):
+        owner = User.objects.create(username="alice", password_hash="-")
+        folder = create_folder_for_user("docs", owner.id)
+        create_folder_for_user("reports", owner.id, parent_id=folder.id)
+        call_command("explain_hot_queries", stdout=io.StringIO())
+
+
+# Benchmarks print their numbers and are skipped unless RUN_BENCHMARKS is set:
+#   RUN_BENCHMARKS=1 python manage.py test core.tests.<Benchmark>
+benchmark = skipUnless(os.getenv("RUN_BENCHMARKS"), "set RUN_BENCHMARKS=1 to run benchmarks")
+
+
+def _percentiles(samples: list[float]) -> str:
+    samples = sorted(samples)
+    p50, p99 = samples[len(samples) // 2], samples[min(len(samples) - 1, len(samples) * 99 // 100)]
+    return f"p50 {p50 * 1000:.0f} ms, p99 {p99 * 1000:.0f} ms over {len(samples)} requests"
+
+
+@benchmark
+class LoginBenchmark(TransactionTestCase):
+    """Login latency during folder listing traffic, and listing latency during a login burst."""
+
+    listing_threads = 4
+    login_threads = 4
+    logins_per_thread = 5
+
+    def setUp(self):
+        token_version_cache.clear()
+        self.user = User.objects.create(username="alice", password_hash=make_password("secret"))
+        for i in range(20):
+            create_folder_for_user(f"folder-{i}", self.user.id)
+        self.token = issue_token_pair(self.user)[0]
+
+    def list_folders(self, stop: threading.Event, latencies: list):
+        client = Client()
+        client.cookies["access_token"] = self.token
+        while not stop.is_set():
+            started = time.perf_counter()
+            self.assertEqual(client.get("/folders").status_code, 200)
+            latencies.append(time.perf_counter() - started)
+
+    def log_in(self, latencies: list):
+        client = Client()
+        body = json.dumps({"username": "alice", "password": "secret"})
+        for _ in range(self.logins_per_thread):
+            started = time.perf_counter()
+            self.assertEqual(client.post("/login", body, content_type="application/json").status_code, 200)
+            latencies.append(time.perf_counter() - started)
+
+    def run_threads(self, targets):
+        threads = [threading.Thread(target=target, args=args) for target, args in targets]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def test_login_under_listing_load(self):
+        stop, idle_listing = threading.Event(), []
+        listing = self.run_threads([(self.list_folders, (stop, idle_listing))] * self.listing_threads)
+        time.sleep(1)
+        stop.set()
+        for thread in listing:
+            thread.join()
+
+        stop, busy_listing, logins = threading.Event(), [], []
+        listing = self.run_threads([(self.list_folders, (stop, busy_listing))] * self.listing_threads)
+        for thread in self.run_threads([(self.log_in, (logins,))] * self.login_threads):
+            thread.join()
+        stop.set()
+        for thread in listing:
+            thread.join()
+
+        print(
+            f"\nlogin under listing load: {_percentiles(logins)}"
+            f"\nlisting alone: {_percentiles(idle_listing)}"
+            f"\nlisting during logins: {_percentiles(busy_listing)}"
+        )
+
+
+@benchmark
+class TokenIssuanceBenchmark(TestCase):
+    duration = 2.0
+
+    def test_tokens_per_second(self):
+        user = User.objects.create(username="alice", password_hash="-")
+        issue_token_pair(user)  # loads the signing key
+
+        pairs, started = 0, time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            while time.perf_counter() - started < self.duration:
+                issue_token_pair(user)
+                pairs += 1
+        elapsed = time.perf_counter() - started
+        # only the refresh token's row is written; the user is never read back
+        self.assertEqual(len(queries), pairs)
+        print(f"\ntoken issuance: {pairs / elapsed:.0f} pairs/s, {2 * pairs / elapsed:.0f} tokens/s")
+
+
+class SlowInMemoryStorage(InMemoryStorage):
+    """InMemoryStorage streaming each blob in `chunks` parts, `chunk_delay` seconds apart, like a slow reader."""
+
+    chunks = 4
+    chunk_delay = 0.02
+
+    def _chunks(self, name, offset, length):
+        data = b"".join(super().open(name, offset, length))
+        size = max(1, -(-len(data) // self.chunks))
+        return [data[i:i + size] for i in range(0, len(data), size)]
+
+    def open(self, name, offset=0, length=None):
+        for chunk in self._chunks(name, offset, length):
+            time.sleep(self.chunk_delay)
+            yield chunk
+
+    async def aopen(self, name, offset=0, length=None):
+        async def chunks(parts):
+            for chunk in parts:
+                await asyncio.sleep(self.chunk_delay)
+                yield chunk
+
+        return chunks(self._chunks(name, offset, length))
+
+
+class SignedSlowInMemoryStorage(SlowInMemoryStorage):
+    supports_signed_urls = True
+
+    def download_url(self, name, filename, content_type, expiry):
+        return f"https://storage.invalid/{name}"
+
+
+def _stored_file(folder, size: int) -> File:
+    version = get_storage().save("a.txt", io.BytesIO(b"x" * size), "text/plain")
+    return File.objects.create(
+        name="a.txt", folder=folder, size=size, blob_name="a.txt", content_type="text/plain",
+        etag=version.etag, modified_at=version.last_modified,
+    )
+
+
+@benchmark
+@override_settings(STORAGE_BACKEND="core.tests.SignedSlowInMemoryStorage")
+class DownloadModeBenchmark(TestCase):
+    """How long a download holds a sync worker in the proxy and redirect modes."""
+
+    downloads = 50
+
+    def setUp(self):
+        get_storage.cache_clear()
+        self.addCleanup(get_storage.cache_clear)
+        token_version_cache.clear()
+
+        owner = User.objects.create(username="alice", password_hash="-")
+        self.token = issue_token_pair(owner)[0]
+        self.file = _stored_file(create_folder_for_user("docs", owner.id), 4096)
+
+    def occupancy(self, mode: str, status: int) -> float:
+        """Mean seconds a download spends in the view and draining its body, i.e. on the worker."""
+        with override_settings(DOWNLOAD_MODE=mode):
+            started = time.perf_counter()
+            for _ in range(self.downloads):
+                request = RequestFactory().get(f"/file/uploaded/{self.file.id}")
+                request.COOKIES["access_token"] = self.token
+                response = blob_views.get_delete_file(request, file_id=self.file.id)
+                self.assertEqual(response.status_code, status)
+                if response.streaming:
+                    b"".join(response.streaming_content)
+            return (time.perf_counter() - started) / self.downloads
+
+    def test_worker_occupancy(self):
+        proxy, redirect = self.occupancy("proxy", 200), self.occupancy("redirect", 302)
+        print(
+            f"\nworker time per download: proxy {proxy * 1000:.1f} ms, redirect {redirect * 1000:.1f} ms"
+            f"\ndownloads per worker per second: proxy {1 / proxy:.0f}, redirect {1 / redirect:.0f}"
+        )
+
+
+@benchmark
+@override_settings(STORAGE_BACKEND="core.tests.SlowInMemoryStorage")
+class AsyncDownloadBenchmark(TestCase):
+    """Concurrent slow downloads through the sync and async views, served as ASGI serves them."""
+
+    concurrency = 50
+
+    def setUp(self):
+        get_storage.cache_clear()
+        self.addCleanup(get_storage.cache_clear)
+        token_version_cache.clear()
+
+        owner = User.objects.create(username="alice", password_hash="-")
+        folder = create_folder_for_user("docs", owner.id)
+        self.token = issue_token_pair(owner)[0]
+        self.file = _stored_file(folder, 4096)
+
+    async def download(self, view):
+        request = AsyncRequestFactory().get(f"/file/uploaded/{self.file.id}")
+        request.COOKIES["access_token"] = self.token
+        # ASGIHandler runs sync views on its single thread-sensitive thread
+        if not iscoroutinefunction(view):
+            view = sync_to_async(view)
+        response = await view(request, file_id=self.file.id)
+        with warnings.catch_warnings():
+            # a sync iterator is drained in that thread too
+            warnings.simplefilter("ignore")
+            body = b"".join([chunk async for chunk in response])
+        self.assertEqual(len(body), 4096)
+
+    async def run_concurrently(self, view) -> float:
+        await self.download(view)  # warm up
+        started = time.perf_counter()
+        await asyncio.gather(*(self.download(view) for _ in range(self.concurrency)))
+        return time.perf_counter() - started
+
+    async def test_concurrent_downloads(self):
+        sync_elapsed = await self.run_concurrently(blob_views.get_delete_file)
+        async_elapsed = await self.run_concurrently(blob_views.aget_delete_file)
+        print(
+            f"\n{self.concurrency} concurrent downloads: "
+            f"sync {self.concurrency / sync_elapsed:.1f} req/s, async {self.concurrency / async_elapsed:.1f} req/s"
+        )
@@ -0,0 +1,152 @@
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from hashlib import md5
+from typing import Optional
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+from core.services.storage import BlobVersion, StorageBackend, block_id, encode_md5, get_storage
+
+# Shared by all uploads; each upload is further limited to
+# UPLOAD_BLOCKS_IN_FLIGHT blocks so one client cannot take every worker.
+_block_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, "UPLOAD_BLOCK_WORKERS", 16), thread_name_prefix="upload-blocks"
+)
+
+
+class StagedUpload(UploadedFile):
+    """
+    A file whose contents are staged as uncommitted blocks in storage.
+    Nothing is visible under `blob_name` until commit() is called.
+    """
+
+    def __init__(self, storage: StorageBackend, file_id: uuid.UUID, name: str, content_type: str,
+                 size: int, block_ids: list[str], content_md5: str, charset=None, content_type_extra=None):
+        super().__init__(None, name, content_type, size, charset, content_type_extra)
+        self.storage = storage
+        self.file_id = file_id
+        self.blob_name = f"{file_id}_{self.name}"
+        self.block_ids = block_ids
+        self.content_md5 = content_md5
+
+    def commit(self) -> BlobVersion:
+        return self.storage.commit_blocks(self.blob_name, self.block_ids, self.content_type, self.content_md5)
+
+    async def acommit(self) -> BlobVersion:
+        return await self.storage.acommit_blocks(self.blob_name, self.block_ids, self.content_type, self.content_md5)
+
+    def discard(self) -> None:
+        self.storage.discard_blocks(self.blob_name)
+
+
+class StagedBlobUploadHandler(FileUploadHandler):
+    """
+    Streams the "file" field of a multipart body straight into storage
+    blocks instead of memory or a temp file. Blocks are staged in parallel,
+    at most UPLOAD_BLOCKS_IN_FLIGHT at a time, so peak memory stays around
+    a few UPLOAD_BLOCK_SIZE buffers per upload. Uploads over MAX_UPLOAD_SIZE
+    or of a disallowed type are stopped mid-stream; the reason is kept in
+    `error` for the view to report.
+    """
+
+    upload_field = "file"
+
+    def __init__(self, request=None, max_size: Optional[int] = None):
+        super().__init__(request)
+        self.error: Optional[str] = None
+        self.max_size = getattr(settings, "MAX_UPLOAD_SIZE", 50 * 1024 * 1024)
+        if max_size is not None:
+            self.max_size = min(self.max_size, max_size)
+        self.block_size = getattr(settings, "UPLOAD_BLOCK_SIZE", 4 * 1024 * 1024)
+        self._in_flight = threading.BoundedSemaphore(getattr(settings, "UPLOAD_BLOCKS_IN_FLIGHT", 4))
+        self._storage: Optional[StorageBackend] = None
+        self._active = False
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        self._active = field_name == self.upload_field and self._storage is None
+        if not self._active:
+            return  # other file fields are read and dropped
+        if content_type not in settings.ALLOWED_MIME_TYPES:
+            self._stop(f"Invalid file type: {content_type}")
+
+        self._storage = get_storage()
+        self._file_id = uuid.uuid4()
+        self._blob_name = f"{self._file_id}_{self.file_name}"
+        self._buffer = bytearray()
+        self._block_ids: list[str] = []
+        self._futures: list[Future] = []
+        self._size = 0
+        self._md5 = md5()
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self._active:
+            return None
+
+        self._size += len(raw_data)
+        if self._size > self.max_size:
+            self._stop("File too large")
+
+        self._md5.update(raw_data)
+        self._buffer += raw_data
+        while len(self._buffer) >= self.block_size:
+            self._stage(bytes(self._buffer[: self.block_size]))
+            del self._buffer[: self.block_size]
+        return None
+
+    def file_complete(self, file_size):
+        if not self._active:
+            return None
+        self._active = False
+
+        if self._buffer:
+            self._stage(bytes(self._buffer))
+            self._buffer = bytearray()
+        self._wait()
+
+        return StagedUpload(
+            self._storage, self._file_id, self.file_name, self.content_type, self._size, self._block_ids,
+            encode_md5(self._md5.digest()), self.charset, self.content_type_extra,
+        )
+
+    def upload_interrupted(self):
+        if self._storage is not None:
+            self._abandon()
+
+    def _stage(self, data: bytes) -> None:
+        # Surface a failed block now rather than after the whole body is read
+        for future in self._futures:
+            if future.done() and future.exception():
+                self._abandon()
+                raise future.exception()
+
+        self._block_ids.append(block_id(len(self._block_ids)))
+        self._in_flight.acquire()
+        future = _block_executor.submit(self._storage.stage_block, self._blob_name, self._block_ids[-1], data)
+        future.add_done_callback(lambda _: self._in_flight.release())
+        self._futures.append(future)
+
+    def _wait(self) -> None:
+        for future in self._futures:
+            try:
+                future.result()
+            except Exception:
+                self._abandon()
+                raise
+
+    def _abandon(self) -> None:
+        for future in self._futures:
+            future.cancel()
+        for future in self._futures:
+            if not future.cancelled():
+                future.exception()
+        self._futures = []
+        if self._block_ids:
+            self._storage.discard_blocks(self._blob_name)
+
+    def _stop(self, error: str):
+        self.error = error
+        if self._storage is not None:
+            self._abandon()
+        raise StopUpload()
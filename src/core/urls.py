@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 from . import blob_views
@@ -7,11 +8,26 @@ urlpatterns = [
     path("login", views.login),
     path("register", views.register),
     path("folders", views.folders),
+    path("folders/export", views.export_files),
     path("session/manage/logout", views.logout),
     path("session/manage/refresh", views.refresh_session),
     path("session/validate", views.validate_session),
-    path("file/upload", blob_views.upload_file),
-    path("file/uploaded/<uuid:file_id>", blob_views.get_delete_file),
+    path("internal/cache-stats", views.cache_stats),
+    path("file/upload", blob_views.aupload_file if settings.ASYNC_BLOB_VIEWS else blob_views.upload_file),
+    path("file/upload/start", blob_views.start_upload),
+    path("file/upload/<uuid:upload_id>", blob_views.upload_session),
+    path("file/upload/<uuid:upload_id>/chunks/<int:index>", blob_views.upload_chunk),
+    path("file/upload/<uuid:upload_id>/complete", blob_views.complete_upload),
+    path(
+        "file/uploaded/<uuid:file_id>",
+        blob_views.aget_delete_file if settings.ASYNC_BLOB_VIEWS else blob_views.get_delete_file,
+    ),
+    path("files/search", views.search_files_view),
+    path("folders/deletions/<uuid:deletion_id>", views.folder_deletion),
+    path("folders/<uuid:folder_id>", views.folder_detail),
+    path("folders/<uuid:folder_id>/tree", views.folder_tree),
     path("folders/<uuid:folder_id>/files", views.get_files),
-    path("folders/<uuid:folder_id>/permissions", views.permissions)
+    path("folders/<uuid:folder_id>/export", views.export_files),
+    path("folders/<uuid:folder_id>/permissions", views.permissions),
+    path("permissions/batch", views.permissions_batch)
 ]
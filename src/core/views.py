@@ -1,19 +1,34 @@
+import hashlib
 import json
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
 from django.shortcuts import render
-from django.http import JsonResponse, HttpRequest
+from django.http import JsonResponse, HttpRequest, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 from django.views.decorators.http import require_POST, require_GET, require_http_methods
-from core.services.auth_service import verify_user_credentials, create_user
+from django.contrib.admin.views.decorators import staff_member_required
+from core.services.auth_service import averify_user_credentials, acreate_user
+from core.services.cache import folder_permission_cache, token_version_cache
+from core.services.hashing import HashingPoolBusy
 from core.services.jwt import (
-    create_access_token,
-    validate_jwt,
-    decode_user_uuid,
-    create_refresh_token,
+    authenticate_access_token,
+    issue_token_pair,
     validate_refresh_jwt,
     expire_refresh_token,
-    get_user_from_refresh_token,
+    rotate_refresh_token,
 )
-from core.services.folders_operations import create_folder_for_user, get_available_folders
-from core.services.helpers import increment_token_version, get_user_by_uuid, get_folder_by_uuid, get_user_folder_permissions, get_files_in_folder, get_user, modify_permissions
+from core.services.folders_operations import create_folder_for_user, get_available_folders, serialize_folder
+from core.services.folders_operations import get_subtree, serialize_subtree_folder, move_folder, rename_folder
+from core.services.helpers import increment_token_version, get_folder_by_uuid, get_user_folder_permissions, get_files_in_folder, serialize_file, get_user, modify_permissions
+from core.services.helpers import PERM_READ, PERM_UPLOAD, PERM_DELETE, PERM_OWNER, bulk_modify_permissions, readable_folder_ids, subtree_permissions
+from core.models import User, Folder, File, FolderDeletion
+from core.services.export import export_files_ndjson
+from core.services.folder_deletion import delete_folder, serialize_folder_deletion
+from core.services.pagination import keyset_page
+from core.services.search import search_files, serialize_search_result, MIN_QUERY_LENGTH
+from core.decorators import jwt_required
 from django.views.decorators.csrf import csrf_exempt
 import uuid
 from django.core.exceptions import ValidationError
@@ -32,9 +47,8 @@ def validate_session(request: HttpRequest) -> JsonResponse:
     Cookie: access_token=...
     """
     token = request.COOKIES.get("access_token")
-    if token is not None and validate_jwt(token):
-        user_id = decode_user_uuid(token)
-        user = get_user_by_uuid(user_id)
+    user = authenticate_access_token(token) if token is not None else None
+    if user is not None:
         return JsonResponse({"message": "success", "username": user.username})
 
     return JsonResponse({"error": "Session expired" if token else "Invalid session"}, status=401)
@@ -51,16 +65,43 @@ def logout(request: HttpRequest) -> JsonResponse:
 
     if ref_token is not None and validate_refresh_jwt(ref_token):
         expire_refresh_token(ref_token)
-    if acc_token is not None and validate_jwt(acc_token):
-        increment_token_version(decode_user_uuid(acc_token))
+    user = authenticate_access_token(acc_token) if acc_token is not None else None
+    if user is not None:
+        increment_token_version(user.id)
         return JsonResponse({"message": "success"})
 
     return JsonResponse({"error": "Invalid session"}, status=403)
 
 
+@require_GET
+@staff_member_required
+def cache_stats(request: HttpRequest) -> JsonResponse:
+    """
+    GET /internal/cache-stats
+    Staff only (admin session). Caches are per process, so the figures
+    are those of the worker that served the request.
+    """
+    response = {}
+    for name, cache in (("tokenVersion", token_version_cache), ("folderPermission", folder_permission_cache)):
+        stats = cache.stats()
+        response[name] = {
+            "size": stats["size"],
+            "hits": stats["hits"],
+            "misses": stats["misses"],
+            "hitRatio": stats["hit_ratio"],
+        }
+    return JsonResponse(response)
+
+
+def _hashing_busy() -> JsonResponse:
+    response = JsonResponse({"error": "Service busy, try again later"}, status=503)
+    response["Retry-After"] = str(settings.PASSWORD_HASHING_RETRY_AFTER)
+    return response
+
+
 @csrf_exempt
 @require_POST
-def login(request: HttpRequest):
+async def login(request: HttpRequest):
     """
     POST /login
     Body: JSON { "username": "...", "password": "..." }
@@ -72,13 +113,15 @@ def login(request: HttpRequest):
     except (KeyError, json.JSONDecodeError):
         return JsonResponse({"error": "Invalid request"}, status=400)
 
-    user = verify_user_credentials(username, password)
+    try:
+        user = await averify_user_credentials(username, password)
+    except HashingPoolBusy:
+        return _hashing_busy()
 
     if not user:
         return JsonResponse({"error": "Invalid username or password"}, status=401)
 
-    jwt = create_access_token(username)
-    refresh_token = create_refresh_token(username)
+    jwt, refresh_token = await sync_to_async(issue_token_pair)(user)
     response = JsonResponse({"message": "success"})
 
     response.set_cookie(
@@ -101,7 +144,7 @@ def login(request: HttpRequest):
 
 @csrf_exempt  # TODO
 @require_POST
-def register(request: HttpRequest):
+async def register(request: HttpRequest):
     """
     POST /register
     Body: { "username": "...", "password": "..." }
@@ -116,7 +159,10 @@ def register(request: HttpRequest):
     if not username or not password:
         return JsonResponse({"error": "Username and password required"}, status=400)
 
-    user = create_user(username=username, password=password)
+    try:
+        user = await acreate_user(username=username, password=password)
+    except HashingPoolBusy:
+        return _hashing_busy()
     if not user:
         return JsonResponse({"error": "Username already exists"}, status=409)
 
@@ -130,14 +176,9 @@ def refresh_session(request: HttpRequest) -> JsonResponse:
     Cookie: refresh_token=...
     """
     ref_token = request.COOKIES.get("refresh_token")
-    if ref_token is not None and validate_refresh_jwt(ref_token):
-        expire_refresh_token(ref_token)
-
-        user = get_user_from_refresh_token(ref_token)
-        if not user:
-            raise ValueError("User not found")
-        acc_token = create_access_token(user.username)
-        ref_token = create_refresh_token(user.username)
+    tokens = rotate_refresh_token(ref_token) if ref_token is not None else None
+    if tokens is not None:
+        acc_token, ref_token = tokens
 
         response = JsonResponse({"message": "success"})
         response.set_cookie("access_token", acc_token, httponly=True, samesite="Lax", secure=True)
@@ -153,18 +194,14 @@ def refresh_session(request: HttpRequest) -> JsonResponse:
 
 @csrf_exempt
 @require_http_methods(["GET", "POST"])
+@jwt_required
 def folders(request: HttpRequest) -> JsonResponse:
     """
     POST /register
     Cookie: access_token=...
     Body: { "name": "" }
     """
-    token = request.COOKIES.get("access_token")
-
-    if token is None or not validate_jwt(token):
-        return JsonResponse({"error": "Unauthorized"}, status=401)
-
-    user_id = decode_user_uuid(token)
+    user_id = str(request.principal.id)
 
     if request.method == "GET":
         return _handle_get_folders(user_id, request)
@@ -172,11 +209,38 @@ def folders(request: HttpRequest) -> JsonResponse:
         return _handle_post_folders(user_id, request)
 
 
+def _conditional(request: HttpRequest, stamp: str, build) -> HttpResponse:
+    """
+    Answer If-None-Match with 304 while `stamp` is unchanged, otherwise
+    call `build` for the full response. The ETag also covers the query
+    string, so every page of a listing has its own tag.
+    """
+    etag = quote_etag(hashlib.sha256(f"{stamp}?{request.GET.urlencode()}".encode()).hexdigest()[:32])
+    response = get_conditional_response(request, etag=etag) or build()
+    if response.status_code in (200, 304):
+        response["ETag"] = etag
+        response["Cache-Control"] = "private, no-cache"
+    return response
+
+
 def _handle_get_folders(user_id: str, request: HttpRequest):
+    version = User.objects.filter(id=user_id).values_list("folders_version", flat=True).first()
+    return _conditional(request, f"folders:{user_id}:{version}", lambda: _build_folders_page(user_id, request))
+
+
+def _build_folders_page(user_id: str, request: HttpRequest):
     page_size = int(request.GET.get("pageSize", 5))
-    page = int(request.GET.get("page", 1))
     folders = get_available_folders(user_id)
 
+    # ?cursor= switches to keyset pagination; an empty cursor starts at the beginning
+    if "cursor" in request.GET:
+        try:
+            rows, next_cursor = keyset_page(folders, request.GET["cursor"], page_size, "folder__name", "folder_id")
+        except ValueError:
+            return JsonResponse({"error": "Invalid pagination data"}, status=400)
+        return JsonResponse({"items": [serialize_folder(row) for row in rows], "next": next_cursor})
+
+    page = int(request.GET.get("page", 1))
     paginator = Paginator(folders, page_size)
 
     try:
@@ -184,46 +248,142 @@ def _handle_get_folders(user_id: str, request: HttpRequest):
     except EmptyPage:
         return JsonResponse({"error": "Invalid pagination data"}, status=400)
 
-    return JsonResponse({"items": page.object_list, "page": page.number, "totalPages": paginator.num_pages})
+    return JsonResponse({
+        "items": [serialize_folder(row) for row in page.object_list],
+        "page": page.number,
+        "totalPages": paginator.num_pages
+    })
 
 
 def _handle_post_folders(user_id: str, request: HttpRequest):
     try:
-        folder_name = json.loads(request.body)["name"]
+        data = json.loads(request.body)
+        folder_name = data["name"]
+        parent_id = uuid.UUID(str(data["parent"])) if data.get("parent") else None
 
-        folder = create_folder_for_user(name=folder_name, owner_id=user_id)
+        folder = create_folder_for_user(name=folder_name, owner_id=user_id, parent_id=parent_id)
     except ValidationError as e:
         return JsonResponse({"error": e.message}, status=400)
-    except (KeyError, json.JSONDecodeError):
+    except (KeyError, ValueError):
         return JsonResponse({"error": "Invalid request"}, status=400)
 
     return JsonResponse({"message": "Folder successfully created", "folder_id": folder.id}, status=201)
 
+@csrf_exempt
+@require_http_methods(["PATCH", "DELETE"])
+@jwt_required
+def folder_detail(request: HttpRequest, folder_id: str) -> JsonResponse:
+    """
+    PATCH /folders/<uuid>
+    Cookie: access_token=...
+    Body: { "name": "...", "parent": "<uuid>" | null }  (both optional)
+
+    DELETE /folders/<uuid>
+    Cookie: access_token=...
+    Deletes the folder, its subfolders and files. Answers 202 at once; the
+    blobs are removed in the background, see GET /folders/deletions/<uuid>.
+    Needs delete permission on every folder of the subtree, so a grant that
+    withholds it further down is not bypassed by deleting an ancestor.
+    """
+    folder = get_folder_by_uuid(folder_id)
+    if request.method == "DELETE":
+        if not folder or not all(perms & PERM_DELETE for perms in subtree_permissions(folder, request.principal).values()):
+            return JsonResponse({"error": "Forbidden"}, status=403)
+
+        deletion = delete_folder(folder, request.principal)
+        response = JsonResponse(serialize_folder_deletion(deletion), status=202)
+        response["Location"] = f"/folders/deletions/{deletion.id}"
+        return response
+
+    if not folder or folder.owner_id != request.principal.id:
+        return JsonResponse({"error": "Forbidden"}, status=403)
+
+    try:
+        data = json.loads(request.body)
+        # a move and a rename in one request apply together or not at all
+        with transaction.atomic():
+            if "parent" in data:
+                parent = None
+                if data["parent"] is not None:
+                    parent = get_folder_by_uuid(uuid.UUID(str(data["parent"])))
+                    if not parent:
+                        raise ValidationError("Parent folder not found.")
+                move_folder(folder, parent)
+            if "name" in data:
+                rename_folder(folder, str(data["name"]))
+    except ValidationError as e:
+        return JsonResponse({"error": e.message}, status=400)
+    except (ValueError, TypeError):
+        return JsonResponse({"error": "Invalid request"}, status=400)
+
+    return JsonResponse({"message": "success"})
+
+
+@require_GET
+@jwt_required
+def folder_deletion(request: HttpRequest, deletion_id: str) -> JsonResponse:
+    """
+    GET /folders/deletions/<uuid>
+    Cookie: access_token=...
+    Progress of a folder deletion started by the caller.
+    """
+    deletion = FolderDeletion.objects.filter(id=deletion_id, user=request.principal).first()
+    if not deletion:
+        return JsonResponse({"error": "Not found"}, status=404)
+    return JsonResponse(serialize_folder_deletion(deletion))
+
+
+@require_GET
+@jwt_required
+def folder_tree(request: HttpRequest, folder_id: str) -> JsonResponse:
+    """
+    GET /folders/<uuid>/tree
+    Cookie: access_token=...
+    """
+    folder = get_folder_by_uuid(folder_id)
+    if not folder or not get_user_folder_permissions(folder, request.principal) & PERM_READ:
+        return JsonResponse({"error": "Forbidden"}, status=403)
+
+    # a nearer grant below the folder can take read away again
+    perms = subtree_permissions(folder, request.principal)
+    rows = [row for row in get_subtree(folder) if perms.get(row["descendant_id"], 0) & PERM_READ]
+    return JsonResponse({"items": [serialize_subtree_folder(row) for row in rows]})
+
+
+@jwt_required
 def get_files(request: HttpRequest, folder_id: str):
-    # 1. Check user's JWT token
-    token = request.COOKIES.get("access_token")
-    if not token or not validate_jwt(token):
-        return JsonResponse({"error": "Unauthorized"}, status=401)
+    # 1. User's JWT token is checked by @jwt_required
 
     # 2. Check if folder exists
     folder = get_folder_by_uuid(folder_id)
-    user = get_user_by_uuid(decode_user_uuid(token))
-    if not folder or not user:
+    user = request.principal
+    if not folder:
         # return 403 to prevent resource enumeration
         return JsonResponse({"error": "Forbidden"}, status=403)
 
     # 3. Check user's permissions for the folder
     perms = get_user_folder_permissions(folder, user)
-    if "read" not in perms:
+    if not perms & PERM_READ:
         return JsonResponse({"error": "Forbidden"}, status=403)
 
+    return _conditional(request, f"files:{folder.id}:{folder.version}", lambda: _build_files_page(folder, request))
+
+
+def _build_files_page(folder: Folder, request: HttpRequest):
     # 4. Get pagination details
     page_size = int(request.GET.get("pageSize", 5))
-    page = int(request.GET.get("page", 1))
 
     # 5. Get file details
     files = get_files_in_folder(folder)
 
+    if "cursor" in request.GET:
+        try:
+            rows, next_cursor = keyset_page(files, request.GET["cursor"], page_size, "name", "id")
+        except ValueError:
+            return JsonResponse({"error": "Invalid pagination data"}, status=400)
+        return JsonResponse({"items": [serialize_file(row) for row in rows], "next": next_cursor})
+
+    page = int(request.GET.get("page", 1))
     paginator = Paginator(files, page_size)
 
     try:
@@ -231,21 +391,23 @@ def get_files(request: HttpRequest, folder_id: str):
     except EmptyPage:
         return JsonResponse({"message": "no files"})
 
-    return JsonResponse({"items": page.object_list, "page": page.number, "totalPages": paginator.num_pages})
+    return JsonResponse({
+        "items": [serialize_file(row) for row in page.object_list],
+        "page": page.number,
+        "totalPages": paginator.num_pages
+    })
 
 
 @csrf_exempt
 @require_http_methods(["GET", "POST"])
+@jwt_required
 def permissions(request: HttpRequest, folder_id: str) -> JsonResponse:
-    # 1. Check user's JWT token
-    token = request.COOKIES.get("access_token")
-    if not token or not validate_jwt(token):
-        return JsonResponse({"error": "Unauthorized"}, status=401)
+    # 1. User's JWT token is checked by @jwt_required
 
     # 2. Check if folder exists
     folder = get_folder_by_uuid(folder_id)
-    user = get_user_by_uuid(decode_user_uuid(token))
-    if not folder or not user:
+    user = request.principal
+    if not folder:
         # return 403 to prevent resource enumeration
         return JsonResponse({"error": "Forbidden"}, status=403)
 
@@ -255,12 +417,13 @@ def permissions(request: HttpRequest, folder_id: str) -> JsonResponse:
 
 def get_user_permissions(**kwargs) -> JsonResponse:
     perms = get_user_folder_permissions(kwargs["folder"], kwargs["user"])
-    return JsonResponse({
-            "read": True if "read" in perms else False,
-            "upload": True if "upload" in perms else False,
-            "delete": True if "delete" in perms else False,
-            "is_owner": True if kwargs["user"].id == kwargs["folder"].owner.id else False
-        })
+    # the response is fully determined by the bitmask
+    return _conditional(kwargs["request"], f"perms:{perms}", lambda: JsonResponse({
+            "read": bool(perms & PERM_READ),
+            "upload": bool(perms & PERM_UPLOAD),
+            "delete": bool(perms & PERM_DELETE),
+            "is_owner": bool(perms & PERM_OWNER)
+        }))
 
 
 def modify_user_permissions(**kwargs) -> JsonResponse:
@@ -273,7 +436,7 @@ def modify_user_permissions(**kwargs) -> JsonResponse:
     folder, user, request = kwargs["folder"], kwargs["user"], kwargs["request"]
 
     # 3. Check user's owner permissions for the folder
-    if user.id != folder.owner.id:
+    if user.id != folder.owner_id:
         return JsonResponse({"error": "Forbidden"}, status=403)
 
     # 4. Get the user
@@ -296,3 +459,110 @@ def modify_user_permissions(**kwargs) -> JsonResponse:
         modify_permissions(folder, user_to_modify, perms)
         return JsonResponse({"message": "success"})
     return JsonResponse({"error": "read, upload and delete permissions required"}, status=400)
+
+
+@csrf_exempt
+@require_POST
+@jwt_required
+def permissions_batch(request: HttpRequest) -> JsonResponse:
+    """
+    POST /permissions/batch
+    Cookie: access_token=...
+    Body: {
+        "folders": ["<uuid>", ...],
+        "entries": [{"username": "...", "perms": {"read": true, "upload": false, "delete": false}}, ...]
+    }
+    """
+    user = request.principal
+
+    try:
+        data = json.loads(request.body)
+        folder_ids = [uuid.UUID(str(folder_id)) for folder_id in data["folders"]]
+        entries = data["entries"]
+    except (KeyError, TypeError, ValueError):
+        return JsonResponse({"error": "Invalid request"}, status=400)
+
+    if not folder_ids or not isinstance(entries, list):
+        return JsonResponse({"error": "Invalid request"}, status=400)
+    if len(entries) * len(folder_ids) > settings.MAX_PERMISSION_BATCH:
+        return JsonResponse({"error": f"at most {settings.MAX_PERMISSION_BATCH} grants per request"}, status=400)
+
+    # 1. Only the owner can share; unknown and foreign folders look the same
+    folders = list(Folder.objects.filter(id__in=folder_ids, owner_id=user.id))
+    if len(folders) != len(set(folder_ids)):
+        return JsonResponse({"error": "Forbidden"}, status=403)
+
+    # 2. Resolve all usernames in one query
+    usernames = [entry.get("username") for entry in entries if isinstance(entry, dict)]
+    user_ids = dict(User.objects.filter(username__in=usernames).values_list("username", "id"))
+
+    # 3. Validate entries one by one
+    results = []
+    grants = {}
+    for entry in entries:
+        username = entry.get("username") if isinstance(entry, dict) else None
+        perms = entry.get("perms") if isinstance(entry, dict) else None
+
+        error = None
+        if not isinstance(username, str) or not isinstance(perms, dict):
+            error = "missing field(s)"
+        elif not set(["read", "upload", "delete"]).issubset(perms.keys()):
+            error = "read, upload and delete permissions required"
+        elif username == user.username:
+            error = "cannot change your own permissions"
+        elif username not in user_ids:
+            error = "user not found"
+        elif user_ids[username] in grants:
+            error = "duplicate entry"
+
+        if error:
+            results.append({"username": username, "status": "error", "error": error})
+        else:
+            grants[user_ids[username]] = perms
+            results.append({"username": username, "status": "success"})
+
+    # 4. Apply all valid grants in a single upsert
+    bulk_modify_permissions(folders, grants)
+    return JsonResponse({"results": results})
+
+
+@require_GET
+@jwt_required
+def search_files_view(request: HttpRequest) -> JsonResponse:
+    """
+    GET /files/search?q=...&mode=contains|prefix&pageSize=...&cursor=...
+    Cookie: access_token=...
+    """
+    query = request.GET.get("q", "").strip()
+    if len(query) < MIN_QUERY_LENGTH:
+        return JsonResponse({"error": f"query must have at least {MIN_QUERY_LENGTH} characters"}, status=400)
+
+    files = search_files(request.principal, query, prefix=request.GET.get("mode") == "prefix")
+    try:
+        page_size = int(request.GET.get("pageSize", 20))
+        rows, next_cursor = keyset_page(files, request.GET.get("cursor", ""), page_size, "name", "id")
+    except ValueError:
+        return JsonResponse({"error": "Invalid pagination data"}, status=400)
+
+    return JsonResponse({"items": [serialize_search_result(row) for row in rows], "next": next_cursor})
+
+
+@require_GET
+@jwt_required
+def export_files(request: HttpRequest, folder_id: str = None) -> HttpResponse:
+    """
+    GET /folders/<uuid>/export  - every file of one folder
+    GET /folders/export         - every file the user can read
+    Cookie: access_token=...
+
+    Streams NDJSON, one {"id", "name", "size", "folderId"} object per line.
+    """
+    if folder_id is None:
+        folder_ids = readable_folder_ids(request.principal)
+    else:
+        folder = get_folder_by_uuid(folder_id)
+        if not folder or not get_user_folder_permissions(folder, request.principal) & PERM_READ:
+            return JsonResponse({"error": "Forbidden"}, status=403)
+        folder_ids = [folder.id]
+
+    return StreamingHttpResponse(export_files_ndjson(folder_ids), content_type="application/x-ndjson")